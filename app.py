@@ -0,0 +1,153 @@
+"""Webhook entry point: serves the bot as an ASGI app instead of long polling.
+
+    gunicorn app:app -k uvicorn.workers.UvicornWorker --workers 1
+
+Keep a single worker: the bot's caches and SQLite writer live in one process.
+
+Environment:
+    WEBHOOK_URL         public base URL Telegram should call (webhook is registered on startup when set)
+    WEBHOOK_SECRET      checked against X-Telegram-Bot-Api-Secret-Token on every request;
+                        required with WEBHOOK_URL, since handlers trust the update's sender
+    UPDATE_QUEUE_SIZE   updates buffered before the endpoint answers 503 and Telegram retries
+    CONCURRENT_UPDATES  updates processed concurrently by the Application
+"""
+import os
+import json
+import asyncio
+from telegram import Update
+from telegram.ext import Application
+
+import bot1
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE") or 1000)
+CONCURRENT_UPDATES = bot1.CONCURRENT_UPDATES
+WEBHOOK_MAX_CONNECTIONS = 40
+
+
+class WebhookApp:
+    """Minimal ASGI app: POST /telegram feeds the update queue, GET /health reports its depth."""
+
+    def __init__(self):
+        self.application = None
+        self.update_queue = None
+
+    async def startup(self):
+        token = bot1.get_bot_token()
+        if not token:
+            raise RuntimeError("BOT_TOKEN is not configured")
+        if WEBHOOK_URL and not WEBHOOK_SECRET:
+            # Without it anyone who finds the URL can post updates "from" an admin (/muteall, /close, /clean)
+            raise RuntimeError("WEBHOOK_SECRET must be set when WEBHOOK_URL is")
+        self.update_queue = asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)
+        builder = (
+            Application.builder()
+            .updater(None)
+            .update_queue(self.update_queue)
+            .concurrent_updates(CONCURRENT_UPDATES)
+        )
+        self.application = bot1.build_application(builder, token)
+        await self.application.initialize()
+        # post_init / post_stop / post_shutdown are only run automatically by run_polling/run_webhook
+        if self.application.post_init:
+            await self.application.post_init(self.application)
+        await self.application.start()
+        if WEBHOOK_URL:
+            await self.application.bot.set_webhook(
+                WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+        print("Bot is running (webhook)...")
+
+    async def shutdown(self):
+        if self.application is None:
+            return
+        await self.application.stop()
+        if self.application.post_stop:
+            await self.application.post_stop(self.application)
+        await self.application.shutdown()
+        if self.application.post_shutdown:
+            await self.application.post_shutdown(self.application)
+
+    def health(self):
+        return {
+            "status": "ok" if self.application and self.application.running else "starting",
+            "update_queue": self.update_queue.qsize() if self.update_queue else 0,
+            "update_queue_max": UPDATE_QUEUE_SIZE,
+            "concurrent_updates": CONCURRENT_UPDATES,
+            "pending_writes": len(bot1.write_queue),
+            "startup_s": bot1.metrics.startup.phases,
+        }
+
+    async def handle_update(self, scope, receive):
+        if WEBHOOK_SECRET:
+            headers = dict(scope["headers"])
+            if headers.get(b"x-telegram-bot-api-secret-token", b"").decode() != WEBHOOK_SECRET:
+                return 403, {"error": "forbidden"}
+        body = await _read_body(receive)
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            return 400, {"error": "invalid update"}
+        try:
+            self.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram redelivers on non-2xx, which is exactly the back-pressure we want
+            return 503, {"error": "update queue full"}
+        return 200, {"ok": True}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        path, method = scope["path"], scope["method"]
+        if path == WEBHOOK_PATH and method == "POST" and self.application:
+            status, payload = await self.handle_update(scope, receive)
+        elif path == "/health" and method == "GET":
+            status, payload = 200, self.health()
+        else:
+            status, payload = 404, {"error": "not found"}
+        await _send_json(send, status, payload)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+app = WebhookApp()
\ No newline at end of file
@@ -0,0 +1,312 @@
+"""Offline benchmark: drives the real handlers against a local stand-in for the Bot API.
+
+    python bench.py                              # 100, 1000 and 10000 participants
+    python bench.py --sizes 50000 --output after.json
+    python bench.py --api-latency 30 --telegram-limits
+
+Each size replays one full session in its own chat, the way a real group runs it:
+/open, a link from every participant (some post twice, some reuse someone else's
+X account), /tracking, "done" from most of them, a few screen recordings, /unsafe,
+/multiple_link, /muteall and /close. Updates go through Application.process_update,
+so filters, @admin_only, the write-behind queue and the storage backend all take
+part; nothing talks to Telegram.
+
+Every step reports throughput, p50/p99 latency per update, time spent in Storage
+calls, Bot API calls by method and handler errors. The result is printed (or
+written with --output) as JSON so two versions can be diffed. The fake API rejects
+texts over 4096 characters like Telegram does, so oversized replies show up as errors.
+startup_s holds the seconds from process start to each startup milestone, up to the
+first update handled. Set BOT_DATABASE_URL to benchmark the Postgres backend instead of
+a throwaway SQLite file.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import contextlib
+import platform
+import tempfile
+import subprocess
+from collections import Counter
+from urllib.parse import parse_qsl
+
+BENCH_TOKEN = "123456:BENCH"
+BENCH_CHAT_BASE = -1009000000000
+ADMIN_ID = 1
+USER_ID_BASE = 100000
+DEFAULT_SIZES = "100,1000,10000"
+MAX_MESSAGE_LENGTH = 4096
+# Share of participants doing each thing in a synthetic session
+SECOND_LINK_RATE = 0.05
+SHARED_ACCOUNT_RATE = 0.01
+DONE_RATE = 0.7
+VIDEO_RATE = 0.1
+
+
+# === FAKE BOT API ===
+class FakeBotAPI:
+    """Just enough of the Bot API over HTTP/1.1 keep-alive for the bot's handlers; counts calls by method."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.server = None
+        self.port = None
+        self._message_id = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+                path = request_line.decode("latin-1").split()[1]
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                status, payload = self.dispatch(path.rsplit("/", 1)[-1], headers.get("content-type", ""), body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def dispatch(self, method, content_type, body):
+        self.calls[method] += 1
+        params = {}
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            for key, value in parse_qsl(body.decode()):
+                try:
+                    params[key] = json.loads(value)
+                except ValueError:
+                    params[key] = value
+        text = params.get("text")
+        if isinstance(text, str) and len(text.encode("utf-16-le")) // 2 > MAX_MESSAGE_LENGTH:
+            return 400, {"ok": False, "error_code": 400, "description": "Bad Request: message is too long"}
+        if method == "getMe":
+            result = {"id": 999, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method == "getChatAdministrators":
+            result = [{"status": "creator", "is_anonymous": False, "user": {"id": ADMIN_ID, "is_bot": False, "first_name": "Admin"}}]
+        elif method.startswith("send") or method == "editMessageText":
+            self._message_id += 1
+            result = {
+                "message_id": params.get("message_id") or self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": params.get("chat_id") or 0, "type": "supergroup"},
+                "text": text or "",
+            }
+        else:
+            result = True  # restrictChatMember, setChatTitle, pinChatMessage, deleteMessage(s), ...
+        return 200, {"ok": True, "result": result}
+
+
+# === SYNTHETIC SESSION ===
+class Session:
+    """Builds the updates of one group session with `participants` members."""
+
+    def __init__(self, chat_id, participants, seed=0):
+        self.chat = {"id": chat_id, "type": "supergroup", "title": f"Bench {participants} [CLOSED]"}
+        self.users = [USER_ID_BASE + i for i in range(participants)]
+        self.random = random.Random(seed)
+        self._update_id = 0
+
+    def message(self, user_id, text=None, **extra):
+        self._update_id += 1
+        message = {
+            "message_id": self._update_id,
+            "date": int(time.time()),
+            "chat": self.chat,
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            **extra,
+        }
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                command = text.split()[0]
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return {"update_id": self._update_id, "message": message}
+
+    def command(self, text):
+        return [self.message(ADMIN_ID, text)]
+
+    def links(self):
+        updates = []
+        for user_id in self.users:
+            updates.append(self.message(user_id, f"my post https://x.com/user{user_id}/status/{user_id}"))
+        for user_id in self.random.sample(self.users, int(len(self.users) * SECOND_LINK_RATE)):
+            updates.append(self.message(user_id, f"and https://x.com/alt{user_id}/status/{user_id + 1}"))
+        for user_id in self.random.sample(self.users, int(len(self.users) * SHARED_ACCOUNT_RATE)):
+            owner = self.random.choice(self.users)
+            updates.append(self.message(user_id, f"https://x.com/user{owner}/status/{user_id + 2}"))
+        return updates
+
+    def done(self):
+        return [self.message(user_id, "done") for user_id in self.random.sample(self.users, int(len(self.users) * DONE_RATE))]
+
+    def videos(self):
+        video = {"file_id": "video", "file_unique_id": "video", "width": 720, "height": 1280, "duration": 30}
+        return [self.message(user_id, video=video) for user_id in self.random.sample(self.users, int(len(self.users) * VIDEO_RATE))]
+
+    def steps(self):
+        return [
+            ("open", self.command("/open")),
+            ("links", self.links()),
+            ("tracking", self.command("/tracking")),
+            ("done", self.done()),
+            ("videos", self.videos()),
+            ("unsafe", self.command("/unsafe")),
+            ("multiple_link", self.command("/multiple_link")),
+            ("muteall", self.command("/muteall")),
+            ("close", self.command("/close")),
+        ]
+
+
+# === RUNNER ===
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+async def run_step(app, api, updates):
+    from telegram import Update
+    import metrics
+
+    db_before, errors_before, calls_before = metrics.db_query_seconds.total(), metrics.handler_errors.total(), Counter(api.calls)
+    latencies = []
+    started = time.perf_counter()
+    for data in updates:
+        update = Update.de_json(data, app.bot)
+        t0 = time.perf_counter()
+        await app.process_update(update)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    return {
+        "updates": len(updates),
+        "seconds": round(elapsed, 4),
+        "updates_per_s": round(len(updates) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "db_s": round(metrics.db_query_seconds.total() - db_before, 4),
+        "api_calls": dict(sorted((api.calls - calls_before).items())),
+        "errors": metrics.handler_errors.total() - errors_before,
+    }
+
+async def run_benchmark(sizes, api_latency, telegram_limits, seed):
+    import bot1
+    from telegram.ext import Application
+
+    api = FakeBotAPI(api_latency)
+    await api.start()
+    app = bot1.build_application(Application.builder().base_url(api.base_url), BENCH_TOKEN)
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    results = []
+    try:
+        for index, participants in enumerate(sizes):
+            chat_id = BENCH_CHAT_BASE - index
+            if not telegram_limits:
+                for limiters in (bot1.bulk_limiters, bot1.message_limiters):
+                    limiters._buckets[chat_id] = bot1.TokenBucket(rate=1e9, capacity=1e9)
+            session = Session(chat_id, participants, seed)
+            steps = {}
+            for name, updates in session.steps():
+                steps[name] = await run_step(app, api, updates)
+            total_updates = sum(step["updates"] for step in steps.values())
+            total_seconds = sum(step["seconds"] for step in steps.values())
+            results.append({
+                "participants": participants,
+                "updates": total_updates,
+                "seconds": round(total_seconds, 4),
+                "updates_per_s": round(total_updates / total_seconds, 1),
+                "db_s": round(sum(step["db_s"] for step in steps.values()), 4),
+                "api_calls": sum(sum(step["api_calls"].values()) for step in steps.values()),
+                "errors": sum(step["errors"] for step in steps.values()),
+                "steps": steps,
+            })
+    finally:
+        await app.stop()
+        await app.post_stop(app)
+        await app.shutdown()
+        await app.post_shutdown(app)
+        await api.stop()
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated participant counts (default %(default)s)")
+    parser.add_argument("--api-latency", type=float, default=0, help="milliseconds the fake API waits before answering")
+    parser.add_argument("--telegram-limits", action="store_true", help="keep the per-chat rate limits used against real Telegram")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    # bot1 reads its database path and metrics port at import time: point it at a throwaway file and keep the port closed
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    os.environ["BOT_DB_PATH"] = os.path.join(workdir, "bench.db")
+    os.environ["BOT_METRICS_PORT"] = "0"
+    logging.getLogger("telegram").setLevel(logging.CRITICAL)  # handler errors are counted, not printed
+
+    started = time.time()
+    with contextlib.redirect_stdout(sys.stderr):  # the bot's own startup lines; stdout is the JSON report
+        results = asyncio.run(run_benchmark(sizes, args.api_latency / 1000, args.telegram_limits, args.seed))
+    import metrics
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "backend": "postgres" if os.getenv("BOT_DATABASE_URL") else "sqlite",
+        "api_latency_ms": args.api_latency,
+        "telegram_limits": args.telegram_limits,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "startup_s": metrics.startup.phases,
+        "sizes": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -1,570 +1,1474 @@
-import os
-import re
-import sqlite3
-import pytz  # For timezone support
-from functools import wraps
-from datetime import datetime, timedelta
-from telegram import Update, ChatPermissions
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from telegram.error import BadRequest
-
-# === CONFIGURATION ===
-# IMPORTANT: PASTE THE FILE ID FOR YOUR GIF HERE
-# To get this, send your GIF to @JsonDumpBot and copy the correct 'file_id' value.
-OPEN_GIF_FILE_ID = 'CgACAgQAAxkBAAEYVE1o1mcYvHtot7qjiudO6nXaCBbw3wAC4AIAAhhPDVOzldaDFsYkKjYE'
-# Default link to be used by /tracking if no custom link is set
-DEFAULT_TRACKING_LINK = "x.com/your_default_username"
-
-SESSION_PHASES = {}
-conn = sqlite3.connect("group_data.db", check_same_thread=False)
-c = conn.cursor()
-
-# === DATABASE SETUP ===
-def setup_database():
-    """Initializes and migrates the database schema."""
-    c.execute("""CREATE TABLE IF NOT EXISTS group_connections (
-        chat_id INTEGER PRIMARY KEY,
-        target_chat_id INTEGER NOT NULL
-    )""")
-    
-    c.execute("""CREATE TABLE IF NOT EXISTS group_settings (
-        chat_id INTEGER PRIMARY KEY,
-        tracking_link TEXT NOT NULL
-    )""")
-
-    for table in ["links", "status", "srlist", "whitelist"]:
-        try:
-            c.execute(f"PRAGMA table_info({table})")
-            columns = [info[1] for info in c.fetchall()]
-            if 'chat_id' not in columns:
-                c.execute(f"ALTER TABLE {table} ADD COLUMN chat_id INTEGER")
-        except sqlite3.OperationalError:
-            pass  # Table doesn't exist, will be created below
-
-    c.execute("""CREATE TABLE IF NOT EXISTS links (
-        id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, telegram_user TEXT,
-        telegram_name TEXT, twitter_user TEXT, full_link TEXT,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-    )""")
-
-    c.execute("""CREATE TABLE IF NOT EXISTS status (
-        chat_id INTEGER NOT NULL, telegram_user TEXT NOT NULL, completed INTEGER DEFAULT 0,
-        last_done DATETIME, PRIMARY KEY (chat_id, telegram_user)
-    )""")
-
-    c.execute("""CREATE TABLE IF NOT EXISTS srlist (
-        chat_id INTEGER NOT NULL, telegram_user TEXT NOT NULL, telegram_name TEXT,
-        added_on DATETIME DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (chat_id, telegram_user)
-    )""")
-
-    c.execute("""CREATE TABLE IF NOT EXISTS whitelist (
-        chat_id INTEGER NOT NULL, telegram_user TEXT NOT NULL,
-        PRIMARY KEY (chat_id, telegram_user)
-    )""")
-    conn.commit()
-
-setup_database()
-
-
-# === REGEX & HELPERS ===
-twitter_regex = re.compile(
-    r"(https?://(?:www\.)?(?:twitter|x)\.com/([A-Za-z0-9_]+)/status/\d+)", re.IGNORECASE
-)
-done_regex = re.compile(r"\b(done|completed|ad|all done|dn)\b", re.IGNORECASE)
-
-def get_effective_chat_id(chat_id):
-    c.execute("SELECT target_chat_id FROM group_connections WHERE chat_id = ?", (chat_id,))
-    row = c.fetchone()
-    return row[0] if row else chat_id
-
-def tg_mention(name, user_id):
-    return f"<a href='tg://user?id={int(user_id)}'>{name}</a>"
-
-def get_main_link(chat_id, telegram_user):
-    c.execute("""
-        SELECT twitter_user, full_link FROM links
-        WHERE chat_id = ? AND telegram_user = ?
-        ORDER BY id DESC LIMIT 1
-    """, (chat_id, telegram_user,))
-    row = c.fetchone()
-    return row if row else None
-
-async def delete_message_job(context: ContextTypes.DEFAULT_TYPE):
-    job_data = context.job.data
-    try:
-        await context.bot.delete_message(chat_id=job_data['chat_id'], message_id=job_data['message_id'])
-    except BadRequest:
-        pass
-
-async def enable_chat(chat):
-    permissions = ChatPermissions(can_send_messages=True, can_send_audios=True, can_send_documents=True, can_send_photos=True, can_send_videos=True, can_send_video_notes=True, can_send_voice_notes=True, can_send_polls=True, can_send_other_messages=True, can_add_web_page_previews=True, can_change_info=False, can_invite_users=True, can_pin_messages=False)
-    await chat.set_permissions(permissions)
-
-async def disable_chat(chat):
-    permissions = ChatPermissions(can_send_messages=False, can_send_audios=False, can_send_documents=False, can_send_photos=False, can_send_videos=False, can_send_video_notes=False, can_send_voice_notes=False, can_send_polls=False, can_send_other_messages=False, can_add_web_page_previews=False, can_change_info=False, can_invite_users=False, can_pin_messages=False)
-    await chat.set_permissions(permissions)
-
-# === ADMIN DECORATOR ===
-def admin_only(func):
-    @wraps(func)
-    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
-        if not update.effective_user or not update.effective_chat: return
-        user = update.effective_user
-        chat = update.effective_chat
-        try:
-            member = await chat.get_member(user.id)
-            if member.status not in ["administrator", "creator"]:
-                await update.message.reply_text("⚠️ **Only admins can use this command.**")
-                return
-        except BadRequest:
-            await update.message.reply_text("⚠️ This command can only be used in a group where I am an admin.")
-            return
-        return await func(update, context, *args, **kwargs)
-    return wrapper
-
-# === SAFELIST COMMANDS ===
-@admin_only
-async def save_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    if not update.message.reply_to_message:
-        await update.message.reply_text("⚠️ Reply to a user's message to add them to the safelist.")
-        return
-    target_user = update.message.reply_to_message.from_user
-    c.execute("INSERT OR IGNORE INTO whitelist (chat_id, telegram_user) VALUES (?, ?)", (effective_chat_id, str(target_user.id)))
-    conn.commit()
-    await update.message.reply_text(f"✅ {tg_mention(target_user.full_name, target_user.id)} has been added to the safelist.", parse_mode="HTML")
-
-@admin_only
-async def unsave_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    if not update.message.reply_to_message:
-        await update.message.reply_text("⚠️ Reply to a user's message to remove them from the safelist.")
-        return
-    target_user = update.message.reply_to_message.from_user
-    c.execute("DELETE FROM whitelist WHERE chat_id = ? AND telegram_user = ?", (effective_chat_id, str(target_user.id)))
-    conn.commit()
-    await update.message.reply_text(f"🗑️ {tg_mention(target_user.full_name, target_user.id)} has been removed from the safelist.", parse_mode="HTML")
-
-@admin_only
-async def list_saved_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    c.execute("SELECT telegram_user FROM whitelist WHERE chat_id = ?", (effective_chat_id,))
-    rows = c.fetchall()
-    if not rows:
-        await update.message.reply_text("📝 The safelist is empty.")
-        return
-    msg = "📝 **Safelisted Users:**\n\n"
-    for idx, (tg_user,) in enumerate(rows, 1):
-        c.execute("SELECT telegram_name FROM links WHERE chat_id = ? AND telegram_user=? ORDER BY id DESC LIMIT 1", (effective_chat_id, tg_user,))
-        name_row = c.fetchone()
-        name = name_row[0] if name_row else f"ID: {tg_user}"
-        msg += f"{idx}. {tg_mention(name, tg_user)}\n"
-    await update.message.reply_text(msg, parse_mode="HTML")
-
-# === CORE COMMANDS ===
-@admin_only
-async def open(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    SESSION_PHASES[effective_chat_id] = "links"
-    chat = update.effective_chat
-    await enable_chat(chat)
-    if "[OPEN]" not in chat.title:
-        new_title = chat.title.replace("[CLOSED]", "").strip() + " [OPEN]"
-        await chat.set_title(new_title)
-    await context.bot.send_animation(chat.id, animation=OPEN_GIF_FILE_ID)
-    message_text = "<b>🚀 Start dropping your post links!</b>"
-    try:
-        sent_message = await context.bot.send_message(chat_id=chat.id, text=message_text, parse_mode="HTML")
-        await context.bot.pin_chat_message(chat_id=chat.id, message_id=sent_message.message_id)
-    except BadRequest as e:
-        error_text = "⚠️ Could not pin message. Please grant 'Pin Messages' admin rights." if "rights" in str(e).lower() else "⚠️ An error occurred while pinning the message."
-        await context.bot.send_message(chat_id=chat.id, text=error_text, parse_mode="HTML")
-
-@admin_only
-async def users(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    c.execute("SELECT COUNT(DISTINCT telegram_user) FROM links WHERE chat_id = ?", (effective_chat_id,))
-    total_unique = c.fetchone()[0]
-    await update.message.reply_text(f"📊 **Total unique users:** {total_unique}")
-
-@admin_only
-async def multiple_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    c.execute("SELECT telegram_user, telegram_name, twitter_user, full_link FROM links WHERE chat_id = ? ORDER BY telegram_user, id", (effective_chat_id,))
-    rows = c.fetchall()
-    
-    user_links = {}
-    for tg_user, tg_name, tw_user, link in rows:
-        user_links.setdefault((tg_user, tg_name), []).append((tw_user, link))
-
-    msg = "🔗 **Multiple Links by Same User**:\n\n"
-    count_multi = 0
-    for (tg_user, tg_name), links in user_links.items():
-        if len(links) > 1:
-            count_multi += 1
-            msg += f"{count_multi}. 🙍🏻‍♂️ {tg_mention(tg_name, tg_user)}\n"
-            for idx, (tw_user, link) in enumerate(links, 1):
-                msg += f"    {idx}. 𝕏 <a href='{link}'>@{tw_user}</a>\n"
-            msg += "\n"
-    if count_multi == 0:
-        msg += "✅ No user shared multiple links.\n\n"
-
-    tw_map = {}
-    for tg_user, tg_name, tw_user, link in rows:
-        tw_map.setdefault(tw_user, []).append((tg_user, tg_name, link))
-
-    msg += "🚨 **Fraud (Same X Username by Different Users)**:\n\n"
-    count_fraud = 0
-    for tw_user, tg_list in tw_map.items():
-        if len({u[0] for u in tg_list}) > 1:
-            count_fraud += 1
-            msg += f"{count_fraud}. 𝕏 @{tw_user}\n"
-            for i, (tg_user, tg_name, link) in enumerate(tg_list, 1):
-                msg += f"    {i}. 🙍🏻‍♂️ {tg_mention(tg_name, tg_user)} → <a href='{link}'>Link</a>\n"
-            msg += "\n"
-    if count_fraud == 0:
-        msg += "✅ No fraud cases found."
-        
-    await update.message.reply_text(msg, parse_mode="HTML")
-
-@admin_only
-async def unsafe(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    c.execute("SELECT DISTINCT telegram_user FROM links WHERE chat_id = ?", (effective_chat_id,))
-    all_users = {u[0] for u in c.fetchall()}
-    c.execute("SELECT telegram_user FROM status WHERE chat_id = ? AND completed=1", (effective_chat_id,))
-    completed_users = {u[0] for u in c.fetchall()}
-    c.execute("SELECT telegram_user FROM whitelist WHERE chat_id = ?", (effective_chat_id,))
-    whitelisted_users = {row[0] for row in c.fetchall()}
-    unsafe_users = all_users - completed_users - whitelisted_users
-    if not unsafe_users:
-        await update.message.reply_text("✅ All users are safe.")
-        return
-    msg = "⚠️ **Unsafe users:**\n\n"
-    for idx, tg_user in enumerate(unsafe_users, 1):
-        c.execute("SELECT telegram_name FROM links WHERE chat_id = ? AND telegram_user=? LIMIT 1", (effective_chat_id, tg_user,))
-        name = (c.fetchone() or ["Unknown"])[0]
-        main = get_main_link(effective_chat_id, tg_user)
-        main_msg = f"→ 𝕏 @{main[0]}" if main else ""
-        msg += f"{idx}. 🙍🏻‍♂️ {tg_mention(name, tg_user)} {main_msg}\n"
-    await update.message.reply_text(msg, parse_mode="HTML")
-
-@admin_only
-async def list_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    c.execute("SELECT DISTINCT telegram_user, telegram_name FROM links WHERE chat_id = ?", (effective_chat_id,))
-    all_users = c.fetchall()
-    if not all_users:
-        await update.message.reply_text("• No users have shared links yet.")
-        return
-    msg = "📋 **User List:**\n\n"
-    for idx, (tg_user, name) in enumerate(all_users, 1):
-        main = get_main_link(effective_chat_id, tg_user)
-        main_msg = f"→ 𝕏 @{main[0]}" if main else ""
-        msg += f"{idx}. 🙍🏻‍♂️ {tg_mention(name, tg_user)} {main_msg}\n"
-    await update.message.reply_text(msg, parse_mode="HTML")
-
-@admin_only
-async def get_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    if update.message.reply_to_message:
-        target_user = update.message.reply_to_message.from_user
-        main = get_main_link(effective_chat_id, str(target_user.id))
-        if main:
-            msg = f"🔗 Link for {tg_mention(target_user.full_name, target_user.id)}:\n<a href='{main[1]}'>@{main[0]}</a>"
-        else:
-            msg = f"⚠️ No link found for {tg_mention(target_user.full_name, target_user.id)}."
-        await update.message.reply_text(msg, parse_mode="HTML")
-        return
-
-    c.execute("SELECT DISTINCT telegram_user, telegram_name FROM links WHERE chat_id = ?", (effective_chat_id,))
-    all_users = c.fetchall()
-    if not all_users:
-        await update.message.reply_text("• No links found.")
-        return
-    msg = "📋 **User Links:**\n\n"
-    for idx, (tg_user, name) in enumerate(all_users, 1):
-        main = get_main_link(effective_chat_id, tg_user)
-        main_msg = f"→ 𝕏 <a href='{main[1]}'>@{main[0]}</a>" if main else ""
-        msg += f"{idx}. 🙍🏻‍♂️ {tg_mention(name, tg_user)} {main_msg}\n"
-    await update.message.reply_text(msg, parse_mode="HTML")
-
-@admin_only
-async def clean_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    count = int(context.args[0]) if context.args and context.args[0].isdigit() else 100
-    chat_id = update.effective_chat.id
-    command_message_id = update.message.message_id
-    deleted_count = 0
-    for message_id in range(command_message_id, command_message_id - count - 1, -1):
-        if message_id <= 0: continue
-        try:
-            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-            deleted_count += 1
-        except BadRequest:
-            pass
-    confirmation_msg = await context.bot.send_message(chat_id=chat_id, text=f"✅️ Chat cleaned. {deleted_count} messages deleted.")
-    context.job_queue.run_once(delete_message_job, 5, data={'chat_id': chat_id, 'message_id': confirmation_msg.message_id})
-
-async def track_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.message or not update.effective_chat: return
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    current_phase = SESSION_PHASES.get(effective_chat_id, "links")
-    user = update.message.from_user
-    text = (update.message.text or "") + " " + (update.message.caption or "")
-    
-    if current_phase == "links":
-        if twitter_regex.search(text):
-            for match in twitter_regex.finditer(text):
-                c.execute(
-                    "INSERT INTO links (chat_id, telegram_user, telegram_name, twitter_user, full_link) VALUES (?, ?, ?, ?, ?)",
-                    (effective_chat_id, str(user.id), user.full_name, match.group(2), match.group(1))
-                )
-            conn.commit()
-    elif current_phase == "done":
-        if done_regex.search(text):
-            c.execute(
-                "INSERT OR REPLACE INTO status (chat_id, telegram_user, completed, last_done) VALUES (?, ?, 1, CURRENT_TIMESTAMP)",
-                (effective_chat_id, str(user.id))
-            )
-            conn.commit()
-            main = get_main_link(effective_chat_id, str(user.id))
-            reply_text = f"✅️ 𝕏 :- @{main[0]}" if main else f"⚠️ {tg_mention(user.full_name, user.id)} No link shared"
-            await update.message.reply_text(reply_text, parse_mode="HTML")
-
-@admin_only
-async def set_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    if not context.args:
-        await update.message.reply_text("**Usage:** `/set <link>`\n**Example:** `/set x.com/your_user`")
-        return
-    new_link = context.args[0]
-    c.execute("INSERT OR REPLACE INTO group_settings (chat_id, tracking_link) VALUES (?, ?)", (effective_chat_id, new_link))
-    conn.commit()
-    await update.message.reply_text(f"✅ Tracking link set to: `{new_link}`", parse_mode="MarkdownV2")
-
-@admin_only
-async def tracking(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    SESSION_PHASES[effective_chat_id] = "done"
-    chat = update.effective_chat
-    if "[OPEN]" in chat.title:
-        await chat.set_title(chat.title.replace("[OPEN]", "[CLOSED]"))
-    elif "[CLOSED]" not in chat.title:
-        await chat.set_title(chat.title.strip() + " [CLOSED]")
-    await enable_chat(chat)
-    c.execute("SELECT tracking_link FROM group_settings WHERE chat_id = ?", (effective_chat_id,))
-    tracking_link = (c.fetchone() or [DEFAULT_TRACKING_LINK])[0]
-    
-    ist_tz = pytz.timezone('Asia/Kolkata')
-    deadline_time = datetime.now(ist_tz) + timedelta(hours=1)
-    deadline_str = deadline_time.strftime("%I:%M %p IST")
-
-    message_text = (
-        " Timeline Updated 👇\n\n"
-        f" {tracking_link}\n\n"
-        "Like all posts of the TL account and\n"
-        "Drop 'done' (or 'ad', 'completed') to be marked safe ✅\n\n"
-        f"⚠️ DEADLINE: {deadline_str}"
-    )
-    try:
-        sent_message = await context.bot.send_message(chat_id=chat.id, text=message_text, disable_web_page_preview=False)
-        await context.bot.pin_chat_message(chat_id=chat.id, message_id=sent_message.message_id)
-    except BadRequest as e:
-        error_text = "⚠️ Could not pin message. Please grant 'Pin Messages' admin rights." if "rights" in str(e).lower() else "⚠️ An error occurred while pinning the message."
-        await context.bot.send_message(chat_id=chat.id, text=error_text, parse_mode="HTML")
-
-@admin_only
-async def mark_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    if not update.message.reply_to_message:
-        await update.message.reply_text("⚠️ Please use this command by replying to a user's message.")
-        return
-    target_user = update.message.reply_to_message.from_user
-    c.execute("INSERT OR REPLACE INTO status (chat_id, telegram_user, completed, last_done) VALUES (?, ?, 1, CURRENT_TIMESTAMP)", (effective_chat_id, str(target_user.id)))
-    conn.commit()
-    main = get_main_link(effective_chat_id, str(target_user.id))
-    reply_text = f"✅️ Manually marked {tg_mention(target_user.full_name, target_user.id)} as done."
-    if main:
-        reply_text += f"\n𝕏 :- @{main[0]}"
-    await update.message.reply_text(reply_text, parse_mode="HTML")
-
-@admin_only
-async def sr(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    if not update.message.reply_to_message:
-        await update.message.reply_text("⚠️ Reply to a user's message to add them to the SR list.")
-        return
-    user = update.message.reply_to_message.from_user
-    c.execute("INSERT OR REPLACE INTO srlist (chat_id, telegram_user, telegram_name) VALUES (?, ?, ?)", (effective_chat_id, str(user.id), user.full_name))
-    conn.commit()
-    await update.message.reply_text(f"⚠️ {tg_mention(user.full_name, user.id)} your likes are not visible.\nSend a screen recording with a visible profile.", parse_mode="HTML")
-
-@admin_only
-async def srlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    c.execute("SELECT telegram_user, telegram_name FROM srlist WHERE chat_id = ?", (effective_chat_id,))
-    rows = c.fetchall()
-    if not rows:
-        await update.message.reply_text("✅ SR list is empty.")
-        return
-    msg = "📹 **SR List (pending recordings):**\n\n"
-    for idx, (tg_user, name) in enumerate(rows, 1):
-        msg += f"{idx}. 🙍🏻‍♂️ {tg_mention(name, tg_user)}\n"
-    await update.message.reply_text(msg, parse_mode="HTML")
-
-async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.message or not update.effective_chat: return
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    user = update.message.from_user
-    c.execute("SELECT 1 FROM srlist WHERE chat_id = ? AND telegram_user=?", (effective_chat_id, str(user.id)))
-    is_in_srlist = c.fetchone()
-    c.execute("INSERT OR REPLACE INTO status (chat_id, telegram_user, completed, last_done) VALUES (?, ?, 1, CURRENT_TIMESTAMP)",(effective_chat_id, str(user.id)))
-    if is_in_srlist:
-        c.execute("DELETE FROM srlist WHERE chat_id = ? AND telegram_user=?", (effective_chat_id, str(user.id)))
-        conn.commit()
-        await update.message.reply_text("✅ Screen recording received. You are marked as 'done' and removed from the SR list.")
-    else:
-        conn.commit()
-        main = get_main_link(effective_chat_id, str(user.id))
-        reply_text = f"✅️ 𝕏 :- @{main[0]}" if main else "✅️ Marked as done."
-        await update.message.reply_text(reply_text, parse_mode="HTML")
-
-@admin_only
-async def muteall(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    duration_str = context.args[0] if context.args else None
-    until_timestamp = None
-    if duration_str:
-        match = re.match(r"(\d+)([dhm])", duration_str.lower())
-        if match:
-            value, unit = int(match.group(1)), match.group(2)
-            delta = {'d': timedelta(days=value), 'h': timedelta(hours=value), 'm': timedelta(minutes=value)}.get(unit)
-            if delta:
-                until_timestamp = int((datetime.utcnow() + delta).timestamp())
-        else:
-            await update.message.reply_text("⚠️ Invalid duration format. Use 1d, 2h, 30m etc.")
-            return
-    c.execute("SELECT DISTINCT telegram_user, telegram_name FROM links WHERE chat_id = ?", (effective_chat_id,))
-    all_users = {u[0]: u[1] for u in c.fetchall()}
-    c.execute("SELECT telegram_user FROM status WHERE chat_id = ? AND completed=1", (effective_chat_id,))
-    completed = {u[0] for u in c.fetchall()}
-    c.execute("SELECT telegram_user, telegram_name FROM srlist WHERE chat_id = ?", (effective_chat_id,))
-    sr_users = {u[0]: u[1] for u in c.fetchall()}
-    c.execute("SELECT telegram_user FROM whitelist WHERE chat_id = ?", (effective_chat_id,))
-    whitelisted_users = {row[0] for row in c.fetchall()}
-    unsafe_users = set(all_users.keys()) - completed
-    final_users_to_mute = (unsafe_users.union(sr_users.keys())) - whitelisted_users
-    if not final_users_to_mute:
-        await update.message.reply_text("✅ No users to mute.")
-        return
-    chat = update.effective_chat
-    muted_list_msgs, failed = [], []
-    for tg_user in final_users_to_mute:
-        try:
-            await chat.restrict_member(int(tg_user), ChatPermissions(can_send_messages=False), until_date=until_timestamp)
-            name = all_users.get(tg_user) or sr_users.get(tg_user, f"ID: {tg_user}")
-            muted_list_msgs.append(f"🙍🏻‍♂️ {tg_mention(name, tg_user)}")
-        except Exception as e:
-            failed.append((tg_user, str(e)))
-    msg = "🔇 **Muted users (unsafe + SR list):**\n\n" + "\n".join(muted_list_msgs)
-    if duration_str: msg += f"\n\n⏱ **Duration:** {duration_str}"
-    if failed: msg += "\n\n❌ **Failed to mute:**\n" + "\n".join([f"- {tg} ({err})" for tg, err in failed])
-    await update.message.reply_text(msg, parse_mode="HTML")
-
-@admin_only
-async def close_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    effective_chat_id = get_effective_chat_id(update.effective_chat.id)
-    c.execute("DELETE FROM links WHERE chat_id = ?", (effective_chat_id,))
-    c.execute("DELETE FROM status WHERE chat_id = ?", (effective_chat_id,))
-    c.execute("DELETE FROM srlist WHERE chat_id = ?", (effective_chat_id,))
-    conn.commit()
-    chat = update.effective_chat
-    await disable_chat(chat)
-    new_title = chat.title.replace("[OPEN]", "").replace("[CLOSED]", "").strip() + " [CLOSED]"
-    await chat.set_title(new_title)
-    if effective_chat_id in SESSION_PHASES:
-        del SESSION_PHASES[effective_chat_id]
-    await update.message.reply_text("🗑️ **Session closed. All data cleared!** 🔒 Chat is now OFF.")
-
-@admin_only
-async def lock_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await disable_chat(update.effective_chat)
-    await update.message.reply_text("🔒 Chat is now OFF. Wait for TL update.")
-
-# === GROUP CONNECTION COMMANDS ===
-@admin_only
-async def connect_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    if not context.args:
-        await update.message.reply_text("Usage: `/connect <target_group_id>`", parse_mode="MarkdownV2")
-        return
-    try:
-        target_chat_id = int(context.args[0])
-        if target_chat_id > 0:
-            await update.message.reply_text("⚠️ Error: Target ID must be a valid group ID (e.g., -100123456).")
-            return
-    except (ValueError, IndexError):
-        await update.message.reply_text("⚠️ Invalid Target Group ID. It must be a number.")
-        return
-    c.execute("INSERT OR REPLACE INTO group_connections (chat_id, target_chat_id) VALUES (?, ?)", (chat_id, target_chat_id))
-    conn.commit()
-    await update.message.reply_text(f"🔗 This group's data is now connected to group ` {target_chat_id}`.", parse_mode="HTML")
-
-@admin_only
-async def disconnect_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    c.execute("DELETE FROM group_connections WHERE chat_id = ?", (chat_id,))
-    conn.commit()
-    await update.message.reply_text("🔌 This group is now disconnected and will use its own local data.")
-
-@admin_only
-async def connection_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    c.execute("SELECT target_chat_id FROM group_connections WHERE chat_id = ?", (chat_id,))
-    row = c.fetchone()
-    if row:
-        await update.message.reply_text(f"🔗 This group shares data with group ` {row[0]}`.", parse_mode="HTML")
-    else:
-        await update.message.reply_text("🏠 This group is using its own local data.")
-
-# === MAIN FUNCTION ===
-def main():
-    BOT_TOKEN = os.getenv("BOT_TOKEN") or "8374636357:AAFfnTJxR7P33lpsPHoOjclZTR1igKhXaNw" 
-    if BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
-        print("ERROR: Please replace 'YOUR_BOT_TOKEN_HERE' with your actual bot token.")
-        return
-
-    app = Application.builder().token(BOT_TOKEN).build()
-
-    # Register all handlers
-    app.add_handler(CommandHandler("open", open))
-    app.add_handler(CommandHandler("tracking", tracking))
-    app.add_handler(CommandHandler("close", close_session))
-    app.add_handler(CommandHandler("l", lock_chat))
-    app.add_handler(CommandHandler("users", users))
-    app.add_handler(CommandHandler("list", list_users))
-    app.add_handler(CommandHandler("link", get_links))
-    app.add_handler(CommandHandler("unsafe", unsafe))
-    app.add_handler(CommandHandler("multiple_link", multiple_link))
-    app.add_handler(CommandHandler("muteall", muteall))
-    app.add_handler(CommandHandler("clean", clean_chat))
-    app.add_handler(CommandHandler("sr", sr))
-    app.add_handler(CommandHandler("srlist", srlist))
-    app.add_handler(CommandHandler("ad", mark_done))
-    app.add_handler(CommandHandler("save", save_user))
-    app.add_handler(CommandHandler("unsave", unsave_user))
-    app.add_handler(CommandHandler("savelist", list_saved_users))
-    app.add_handler(CommandHandler("set", set_link))
-    app.add_handler(CommandHandler("connect", connect_group))
-    app.add_handler(CommandHandler("disconnect", disconnect_group))
-    app.add_handler(CommandHandler("connection_status", connection_status))
-
-    # Message handlers
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, track_message))
-    app.add_handler(MessageHandler(filters.VIDEO, handle_video))
-
-    print("Bot is running...")
-    app.run_polling()
-
-if __name__ == "__main__":
+import os
+import re
+import io
+import asyncio
+import time
+from functools import wraps, partial
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from telegram import Update, ChatPermissions
+from telegram.ext import Application, CommandHandler, MessageHandler, ChatMemberHandler, filters, ContextTypes
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+import metrics
+from storage import Storage, open_storage
+
+# === CONFIGURATION ===
+# IMPORTANT: PASTE THE FILE ID FOR YOUR GIF HERE
+# To get this, send your GIF to @JsonDumpBot and copy the correct 'file_id' value.
+OPEN_GIF_FILE_ID = 'CgACAgQAAxkBAAEYVE1o1mcYvHtot7qjiudO6nXaCBbw3wAC4AIAAhhPDVOzldaDFsYkKjYE'
+# Default link to be used by /tracking if no custom link is set
+DEFAULT_TRACKING_LINK = "x.com/your_default_username"
+# Updates handled at once when polling: a paced report or /muteall in one group must not hold up the rest
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES") or 64)
+# Write-behind batching for hot-path inserts (links / status)
+WRITE_FLUSH_INTERVAL = 2  # seconds between background flushes
+WRITE_BATCH_SIZE = 200    # flush immediately once this many writes are buffered
+WRITE_MAX_ATTEMPTS = 5    # failed flushes of the same writes before they move to the dead-letter list
+WRITE_DEAD_LETTER_MAX = 10000  # failed writes kept for inspection, oldest dropped first
+# Admin-status cache used by @admin_only
+ADMIN_CACHE_TTL = 300      # seconds a cached admin check stays valid
+ADMIN_CACHE_SIZE = 10000   # (chat, user) entries kept before LRU eviction
+# Bulk moderation (/muteall): per-chat token bucket + bounded concurrency
+BULK_CONCURRENCY = 8
+BULK_RATE = 20             # restrict/delete calls per second per chat
+BULK_BURST = 20
+# Messages the bot posts in a group (report pages, batched confirmations, summaries)
+MESSAGE_RATE = 20 / 60     # Telegram allows about 20 messages per minute in one group
+MESSAGE_BURST = 3
+CHAT_LIMITER_SIZE = 2000   # chats whose rate-limit buckets are kept, least recently used dropped first
+BULK_MAX_RETRIES = 5       # attempts per call when Telegram answers with RetryAfter
+PROGRESS_EDIT_INTERVAL = 3 # seconds between edits of a progress message
+# /clean: batched deleteMessages calls
+CLEAN_DEFAULT_COUNT = 100
+CLEAN_MAX_COUNT = 10000
+CLEAN_BATCH_SIZE = 100     # Telegram's deleteMessages limit
+CLEAN_CONCURRENCY = 4
+CLEAN_TIME_BUDGET = 60     # seconds; chunks not started by then are skipped
+# Reports (/list, /link, /unsafe, /multiple_link)
+REPORT_PAGE_LIMIT = 4000   # Telegram rejects messages over 4096 characters
+REPORT_SEND_CONCURRENCY = 3
+REPORT_CSV_SPOOL = 1024 * 1024  # CSV attachments spill to disk beyond this size
+# /close: links of the closed session are deleted in the background in bounded batches
+TEARDOWN_BATCH_SIZE = 2000
+TEARDOWN_PAUSE = 0.05      # seconds between batches, so other chats' writes get the DB in between
+# "done" confirmations are coalesced per chat instead of one reply per message
+REPLY_BATCH_WINDOW = 3     # seconds to collect confirmations before sending
+REPLY_BATCH_MAX = 50       # send as soon as this many are waiting
+# Per-chat state cache (roster, completed, safelist, SR list, session)
+CHAT_STATE_SIZE = 2000     # chats kept in memory before LRU eviction
+CHAT_STATE_IDLE = 1800     # seconds without updates before a chat is dropped
+CHAT_STATE_SWEEP = 60      # seconds between idle sweeps
+# /tracking deadline: unsafe users are muted automatically when it passes
+DEADLINE_HOURS = 1
+DEADLINE_STAGGER = 300     # seconds; each chat fires at a fixed offset in [0, stagger) to spread API load
+# Set by shard.py for each worker; on a shared database a worker resumes only the chats it owns
+SHARD_INDEX = int(os.getenv("BOT_SHARD_INDEX") or 0)
+SHARD_COUNT = int(os.getenv("BOT_SHARD_COUNT") or 1)
+
+# === DATABASE ===
+# SQLite by default; set BOT_DATABASE_URL to run on Postgres (see storage.py)
+storage = open_storage()
+metrics.instrument_storage(storage, Storage)
+
+def owns_chat(effective_chat_id):
+    # Same split as shard.shard_for, which routes the chat's updates to this worker
+    return abs(effective_chat_id) % SHARD_COUNT == SHARD_INDEX
+
+# === PER-CHAT STATE ===
+DEFAULT_PHASE = "links"
+SESSION_FIELDS = ("phase", "deadline", "opened_at", "closed_at", "deadline_chat")
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+class SessionRecord:
+    """A chat's session_state row."""
+    __slots__ = SESSION_FIELDS
+
+    def __init__(self, phase=DEFAULT_PHASE, deadline=None, opened_at=None, closed_at=None, deadline_chat=None):
+        self.phase, self.deadline, self.opened_at, self.closed_at, self.deadline_chat = phase, deadline, opened_at, closed_at, deadline_chat
+
+class RosterEntry:
+    """A participant's latest link."""
+    __slots__ = ("name", "twitter_user", "link")
+
+    def __init__(self, name, twitter_user, link):
+        self.name, self.twitter_user, self.link = name, twitter_user, link
+
+class ChatState:
+    """Everything the handlers need about one (effective) chat.
+
+    `session` is read when the state is created; roster, completed, whitelist and srlist are
+    each loaded on first use (None until then). `loading` maps a field being loaded to the
+    (task, deferred changes) that are applied once the load lands."""
+    __slots__ = ("chat_id", "session", "roster", "completed", "whitelist", "srlist", "loading", "last_used")
+
+    def __init__(self, chat_id, session):
+        self.chat_id = chat_id
+        self.session = session
+        self.roster = self.completed = self.whitelist = self.srlist = None
+        self.loading = None
+        self.last_used = time.monotonic()
+
+async def _load_roster(chat_id):
+    await write_queue.flush("links")
+    await session_teardown.wait(chat_id)
+    return {tg_user: RosterEntry(name, tw_user, link) async for tg_user, name, tw_user, link in storage.stream_latest_links(chat_id)}
+
+async def _load_completed(chat_id):
+    await write_queue.flush("status")
+    return await storage.completed_users(chat_id)
+
+async def _load_whitelist(chat_id):
+    return set(await storage.whitelist_users(chat_id))
+
+async def _load_srlist(chat_id):
+    return dict(await storage.sr_users(chat_id))
+
+class ChatStateCache:
+    """LRU of ChatState with an idle timeout, so memory stays bounded however many groups the bot is in.
+
+    Every write path updates the DB first and then the cached copy (if that part is loaded), so
+    an evicted chat simply reloads from the DB on its next update."""
+
+    def __init__(self, maxsize=CHAT_STATE_SIZE, idle=CHAT_STATE_IDLE):
+        self.maxsize = maxsize
+        self.idle = idle
+        self._states = OrderedDict()
+
+    def __len__(self):
+        return len(self._states)
+
+    async def get(self, chat_id):
+        state = self._states.get(chat_id)
+        if state is None:
+            metrics.cache_lookups.inc("chat_state", "miss")
+            row = await storage.get_session(chat_id)
+            state = self._states.get(chat_id)  # loaded concurrently meanwhile?
+            if state is None:
+                state = self._states[chat_id] = ChatState(chat_id, SessionRecord(*row) if row else SessionRecord())
+                while len(self._states) > self.maxsize:
+                    self._states.popitem(last=False)
+                    metrics.cache_evictions.inc("chat_state", "size")
+        else:
+            metrics.cache_lookups.inc("chat_state", "hit")
+        state.last_used = time.monotonic()
+        self._states.move_to_end(chat_id)
+        return state
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle
+        while self._states:
+            chat_id, state = next(iter(self._states.items()))
+            if state.last_used >= cutoff:
+                break
+            del self._states[chat_id]
+            metrics.cache_evictions.inc("chat_state", "idle")
+
+    async def _field(self, chat_id, field, loader):
+        state = await self.get(chat_id)
+        while getattr(state, field) is None:
+            pending = (state.loading or {}).get(field)
+            if pending is not None:
+                await asyncio.wait([pending[0]])  # someone else is loading it
+                continue
+            task = asyncio.ensure_future(loader(chat_id))
+            deferred = []
+            state.loading = dict(state.loading or {}, **{field: (task, deferred)})
+            try:
+                value = await task
+            finally:
+                del state.loading[field]
+            # Changes made while the load was in flight may be missing from what it read
+            for change in deferred:
+                change(value)
+            setattr(state, field, value)
+        return getattr(state, field)
+
+    def _change(self, chat_id, field, change):
+        state = self._states.get(chat_id)
+        if state is None:
+            return
+        value = getattr(state, field)
+        if value is not None:
+            change(value)
+        elif state.loading and field in state.loading:
+            state.loading[field][1].append(change)
+
+    # --- session ---
+    async def session(self, chat_id):
+        return (await self.get(chat_id)).session
+
+    async def phase(self, chat_id):
+        return (await self.get(chat_id)).session.phase
+
+    async def update_session(self, chat_id, **changes):
+        session = (await self.get(chat_id)).session
+        values = {field: changes.get(field, getattr(session, field)) for field in SESSION_FIELDS}
+        await storage.save_session(chat_id, *values.values())
+        for field, value in values.items():
+            setattr(session, field, value)
+        return session
+
+    # --- roster: latest link per participant, in order of first link ---
+    async def roster(self, chat_id):
+        return await self._field(chat_id, "roster", _load_roster)
+
+    def record_link(self, chat_id, telegram_user, name, twitter_user, link):
+        def change(roster):
+            entry = roster.get(telegram_user)
+            if entry is None:
+                roster[telegram_user] = RosterEntry(name, twitter_user, link)
+            else:
+                entry.name, entry.twitter_user, entry.link = name, twitter_user, link
+        self._change(chat_id, "roster", change)
+
+    # --- users marked done ---
+    async def completed(self, chat_id):
+        return await self._field(chat_id, "completed", _load_completed)
+
+    def mark_completed(self, chat_id, telegram_user):
+        self._change(chat_id, "completed", lambda completed: completed.add(telegram_user))
+
+    # --- safelist ---
+    async def whitelist(self, chat_id):
+        return await self._field(chat_id, "whitelist", _load_whitelist)
+
+    def whitelist_added(self, chat_id, telegram_user):
+        self._change(chat_id, "whitelist", lambda whitelist: whitelist.add(telegram_user))
+
+    def whitelist_removed(self, chat_id, telegram_user):
+        self._change(chat_id, "whitelist", lambda whitelist: whitelist.discard(telegram_user))
+
+    # --- SR list: user -> name ---
+    async def srlist(self, chat_id):
+        return await self._field(chat_id, "srlist", _load_srlist)
+
+    def sr_added(self, chat_id, telegram_user, name):
+        self._change(chat_id, "srlist", lambda srlist: srlist.__setitem__(telegram_user, name))
+
+    def sr_removed(self, chat_id, telegram_user):
+        self._change(chat_id, "srlist", lambda srlist: srlist.pop(telegram_user, None))
+
+    def session_closed(self, chat_id):
+        """/close archived the session: its links, completions and SR list are gone."""
+        self._change(chat_id, "roster", dict.clear)
+        self._change(chat_id, "completed", set.clear)
+        self._change(chat_id, "srlist", dict.clear)
+
+chat_states = ChatStateCache()
+
+async def evict_idle_chats_job(context: ContextTypes.DEFAULT_TYPE):
+    chat_states.evict_idle()
+
+# === WRITE-BEHIND QUEUE ===
+class WriteBehindQueue:
+    """Buffers hot-path writes in memory and commits them in one transaction per batch.
+
+    A batch that fails transiently is kept and retried, up to WRITE_MAX_ATTEMPTS flushes; after
+    that, or on any other error, its writes are logged and moved to `dead_letters`."""
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._pending = []
+        self._tables = set()
+        self._lock = asyncio.Lock()
+        self._failures = 0
+        self._retry_at = 0
+        self.dead_letters = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def enqueue(self, table, statement, params):
+        """Buffers one write; `statement` is a storage.WRITE_STATEMENTS key."""
+        self._pending.append((table, statement, params))
+        self._tables.add(table)
+        # After a failed flush, leave retries to flush_writes_job instead of every handler
+        if len(self._pending) >= self.batch_size and time.monotonic() >= self._retry_at:
+            try:
+                await self.flush()
+            except storage.transient_errors:
+                pass  # the write stays buffered
+
+    async def flush(self, *tables):
+        """Commits everything buffered. With `tables`, only flushes if one of them has pending writes."""
+        # Holding the lock first means an in-flight batch is committed before we return
+        async with self._lock:
+            if not self._pending or (tables and self._tables.isdisjoint(tables)):
+                return 0
+            batch, self._pending = self._pending, []
+            self._tables = set()
+            try:
+                await storage.apply_writes([(statement, params) for _, statement, params in batch])
+            except Exception as e:
+                self._failures += 1
+                if storage.is_transient(e) and self._failures < WRITE_MAX_ATTEMPTS:
+                    # e.g. database locked or connection lost: keep the batch for the next flush
+                    self._pending[:0] = batch
+                    self._tables.update(table for table, _, _ in batch)
+                    self._retry_at = time.monotonic() + WRITE_FLUSH_INTERVAL
+                    raise
+                self._dead_letter(batch, e)
+                return 0
+            self._failures = 0
+            return len(batch)
+
+    def _dead_letter(self, batch, error):
+        print(f"Write-behind: {len(batch)} writes failed after {self._failures} attempts ({error!r}); moved to dead_letters")
+        self._failures = 0
+        self.dead_letters.extend(batch)
+        overflow = len(self.dead_letters) - WRITE_DEAD_LETTER_MAX
+        if overflow > 0:
+            print(f"Write-behind: dropped the {overflow} oldest dead letters")
+            del self.dead_letters[:overflow]
+
+write_queue = WriteBehindQueue()
+metrics.registry.add(metrics.GaugeMetric("bot_write_queue_depth", "Writes buffered in the write-behind queue.", lambda: len(write_queue)))
+metrics.registry.add(metrics.GaugeMetric("bot_write_dead_letters", "Writes that failed for good and were set aside.", lambda: len(write_queue.dead_letters)))
+metrics.registry.add(metrics.GaugeMetric("bot_chat_states", "Chats whose state is held in memory.", lambda: len(chat_states)))
+
+async def flush_writes_job(context: ContextTypes.DEFAULT_TYPE):
+    await write_queue.flush()
+
+# === SESSION TEARDOWN ===
+class SessionTeardown:
+    """Deletes closed sessions' links in the background, one purge task per chat.
+
+    /close archives the session summary and clears status/srlist right away; the links up to
+    the archived cutoff go in TEARDOWN_BATCH_SIZE chunks afterwards. Reads of a chat's links
+    wait for its purge so they never see a half-deleted session. Unfinished purges are
+    picked up again from session_archive at startup."""
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def close(self, chat_id, opened_at, closed_at):
+        archive_id, cutoff = await storage.archive_session(chat_id, opened_at, closed_at)
+        self.start(archive_id, chat_id, cutoff)
+
+    def start(self, archive_id, chat_id, cutoff):
+        previous = self._tasks.get(chat_id)
+        task = self._tasks[chat_id] = asyncio.ensure_future(self._purge(archive_id, chat_id, cutoff, previous))
+        task.add_done_callback(lambda _: self._tasks.pop(chat_id, None) if self._tasks.get(chat_id) is task else None)
+
+    async def _purge(self, archive_id, chat_id, cutoff, previous):
+        if previous:
+            await asyncio.wait([previous])
+        try:
+            while await storage.purge_links(chat_id, cutoff, TEARDOWN_BATCH_SIZE) == TEARDOWN_BATCH_SIZE:
+                await asyncio.sleep(TEARDOWN_PAUSE)
+            await storage.mark_purged(archive_id)
+            await storage.reclaim_space()
+        except storage.transient_errors as e:
+            print(f"Purge of chat {chat_id} interrupted ({e}); it resumes on the next start")
+
+    async def wait(self, chat_id):
+        task = self._tasks.get(chat_id)
+        if task:
+            await asyncio.wait([task])
+
+    async def resume(self):
+        for archive_id, chat_id, cutoff in await storage.pending_purges():
+            if owns_chat(chat_id):
+                self.start(archive_id, chat_id, cutoff)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+session_teardown = SessionTeardown()
+
+# === REGEX & HELPERS ===
+twitter_regex = re.compile(
+    r"(https?://(?:www\.)?(?:twitter|x)\.com/([A-Za-z0-9_]+)/status/\d+)", re.IGNORECASE
+)
+done_regex = re.compile(r"\b(done|completed|ad|all done|dn)\b", re.IGNORECASE)
+# Cheap substring checks that must pass before either regex runs
+LINK_HINT = "/status/"
+DONE_HINTS = ("done", "completed", "ad", "dn")
+
+def extract_links(parts):
+    """Yields (twitter_user, full_link) for every status link in the message parts, scanning each part once."""
+    for part in parts:
+        if part and LINK_HINT in part.lower():
+            for match in twitter_regex.finditer(part):
+                yield match.group(2), match.group(1)
+
+def is_done_message(parts):
+    for part in parts:
+        if not part:
+            continue
+        lowered = part.lower()
+        if any(hint in lowered for hint in DONE_HINTS) and done_regex.search(part):
+            return True
+    return False
+
+class ConnectionCache:
+    """Process-wide copy of group_connections, loaded at startup and kept current by /connect and /disconnect."""
+
+    def __init__(self):
+        self._targets = {}
+        self.loaded = False
+        # Called as listener(chat_id, target_chat_id_or_None) after /connect or /disconnect (used by shard.py)
+        self.listeners = []
+
+    async def load(self):
+        self._targets = await storage.load_connections()
+        self.loaded = True
+
+    async def resolve(self, chat_id):
+        if not self.loaded:
+            metrics.cache_lookups.inc("connections", "miss")
+            await self.load()
+        target = self._targets.get(chat_id)
+        metrics.cache_lookups.inc("connections", "direct" if target is None else "connected")
+        return chat_id if target is None else target
+
+    def target(self, chat_id):
+        return self._targets.get(chat_id)
+
+    def set(self, chat_id, target_chat_id):
+        self._targets[chat_id] = target_chat_id
+
+    def discard(self, chat_id):
+        self._targets.pop(chat_id, None)
+
+connection_cache = ConnectionCache()
+
+async def save_group_connection(chat_id, target_chat_id, notify=True):
+    """Persists a connection (or its removal when `target_chat_id` is None) and updates the cache."""
+    if target_chat_id is None:
+        await storage.delete_connection(chat_id)
+        connection_cache.discard(chat_id)
+    else:
+        await storage.save_connection(chat_id, target_chat_id)
+        connection_cache.set(chat_id, target_chat_id)
+    if notify:
+        for listener in connection_cache.listeners:
+            listener(chat_id, target_chat_id)
+
+async def get_effective_chat_id(chat_id):
+    return await connection_cache.resolve(chat_id)
+
+def tg_mention(name, user_id):
+    return f"<a href='tg://user?id={int(user_id)}'>{name}</a>"
+
+async def get_main_link(chat_id, telegram_user):
+    entry = (await chat_states.roster(chat_id)).get(telegram_user)
+    return (entry.twitter_user, entry.link) if entry else None
+
+async def stream_latest_links(chat_id):
+    await write_queue.flush("links")
+    await session_teardown.wait(chat_id)
+    async for row in storage.stream_latest_links(chat_id):
+        yield row
+
+async def delete_message_job(context: ContextTypes.DEFAULT_TYPE):
+    job_data = context.job.data
+    try:
+        await context.bot.delete_message(chat_id=job_data['chat_id'], message_id=job_data['message_id'])
+    except BadRequest:
+        pass
+
+async def enable_chat(chat):
+    permissions = ChatPermissions(can_send_messages=True, can_send_audios=True, can_send_documents=True, can_send_photos=True, can_send_videos=True, can_send_video_notes=True, can_send_voice_notes=True, can_send_polls=True, can_send_other_messages=True, can_add_web_page_previews=True, can_change_info=False, can_invite_users=True, can_pin_messages=False)
+    await chat.set_permissions(permissions)
+
+async def disable_chat(chat):
+    permissions = ChatPermissions(can_send_messages=False, can_send_audios=False, can_send_documents=False, can_send_photos=False, can_send_videos=False, can_send_video_notes=False, can_send_voice_notes=False, can_send_polls=False, can_send_other_messages=False, can_add_web_page_previews=False, can_change_info=False, can_invite_users=False, can_pin_messages=False)
+    await chat.set_permissions(permissions)
+
+# === ADMIN DECORATOR ===
+class AdminCache:
+    """TTL + LRU cache of (chat, user) -> is-admin, refilled in bulk from get_chat_administrators."""
+
+    def __init__(self, ttl=ADMIN_CACHE_TTL, maxsize=ADMIN_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._refreshing = {}
+
+    def _get(self, chat_id, user_id):
+        key = (chat_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, is_admin = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            metrics.cache_evictions.inc("admins", "expired")
+            return None
+        self._entries.move_to_end(key)
+        return is_admin
+
+    def _put(self, chat_id, user_id, is_admin, expires):
+        self._entries[(chat_id, user_id)] = (expires, is_admin)
+        self._entries.move_to_end((chat_id, user_id))
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            metrics.cache_evictions.inc("admins", "size")
+
+    async def _refresh(self, chat):
+        admins = await chat.get_administrators()
+        expires = time.monotonic() + self.ttl
+        admin_ids = {member.user.id for member in admins}
+        for user_id in admin_ids:
+            self._put(chat.id, user_id, True, expires)
+        return admin_ids, expires
+
+    async def is_admin(self, chat, user_id):
+        cached = self._get(chat.id, user_id)
+        if cached is not None:
+            metrics.cache_lookups.inc("admins", "hit")
+            return cached
+        metrics.cache_lookups.inc("admins", "miss")
+        # Concurrent misses in the same chat share one get_chat_administrators call
+        task = self._refreshing.get(chat.id)
+        if task is None:
+            task = self._refreshing[chat.id] = asyncio.ensure_future(self._refresh(chat))
+            task.add_done_callback(lambda _: self._refreshing.pop(chat.id, None))
+        admin_ids, expires = await asyncio.shield(task)
+        is_admin = user_id in admin_ids
+        if not is_admin:
+            self._put(chat.id, user_id, False, expires)
+        return is_admin
+
+    def invalidate(self, chat_id, user_id=None):
+        if user_id is not None:
+            self._entries.pop((chat_id, user_id), None)
+            return
+        for key in [key for key in self._entries if key[0] == chat_id]:
+            del self._entries[key]
+
+admin_cache = AdminCache()
+
+async def track_member_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.my_chat_member:
+        # The bot's own rights changed: forget everything cached for that chat
+        admin_cache.invalidate(update.my_chat_member.chat.id)
+    elif update.chat_member:
+        admin_cache.invalidate(update.chat_member.chat.id, update.chat_member.new_chat_member.user.id)
+
+def admin_only(func):
+    @wraps(func)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        if not update.effective_user or not update.effective_chat: return
+        user = update.effective_user
+        chat = update.effective_chat
+        try:
+            if not await admin_cache.is_admin(chat, user.id):
+                await update.message.reply_text("⚠️ **Only admins can use this command.**")
+                return
+        except BadRequest:
+            await update.message.reply_text("⚠️ This command can only be used in a group where I am an admin.")
+            return
+        return await func(update, context, *args, **kwargs)
+    return wrapper
+
+# === BULK MODERATION ===
+class TokenBucket:
+    """Async token bucket: `rate` calls per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate=BULK_RATE, capacity=BULK_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Holds every caller back, e.g. while Telegram's flood wait is running."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class ChatLimiters:
+    """One TokenBucket per chat, LRU-bounded so buckets of long-quiet groups don't pile up.
+    A dropped bucket simply starts full the next time its chat needs one."""
+
+    def __init__(self, name, rate, capacity, maxsize=CHAT_LIMITER_SIZE):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def get(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.rate, self.capacity)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+                metrics.cache_evictions.inc(self.name, "size")
+        else:
+            self._buckets.move_to_end(chat_id)
+        return bucket
+
+bulk_limiters = ChatLimiters("bulk_limiters", BULK_RATE, BULK_BURST)
+message_limiters = ChatLimiters("message_limiters", MESSAGE_RATE, MESSAGE_BURST)
+
+def chat_limiter(chat_id):
+    """Bucket for bulk moderation calls (restrictChatMember, deleteMessages) in one chat."""
+    return bulk_limiters.get(chat_id)
+
+def message_limiter(chat_id):
+    """Bucket for sendMessage/sendDocument in one chat, sized to Telegram's per-group message limit."""
+    return message_limiters.get(chat_id)
+
+def retry_after_seconds(error):
+    delay = error.retry_after
+    return delay.total_seconds() if isinstance(delay, timedelta) else delay
+
+async def call_with_retry(limiter, fn, *args, **kwargs):
+    """Calls the Telegram coroutine `fn` under `limiter`, sleeping out any RetryAfter."""
+    for attempt in range(BULK_MAX_RETRIES):
+        await limiter.acquire()
+        try:
+            return await fn(*args, **kwargs)
+        except RetryAfter as e:
+            if attempt == BULK_MAX_RETRIES - 1:
+                raise
+            limiter.pause(retry_after_seconds(e))
+
+async def run_bulk(items, action, limiter, concurrency=BULK_CONCURRENCY, on_progress=None):
+    """Runs `action(item)` for every item with bounded concurrency. Returns (succeeded, [(item, error)])."""
+    pending = iter(items)
+    succeeded, failed = [], []
+
+    async def worker():
+        for item in pending:
+            try:
+                await call_with_retry(limiter, action, item)
+                succeeded.append(item)
+            except Exception as e:
+                failed.append((item, str(e)))
+            if on_progress:
+                await on_progress(len(succeeded) + len(failed))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return succeeded, failed
+
+# BadRequest texts that no smaller batch can get around (lowercased substrings)
+CHAT_WIDE_DELETE_ERRORS = ("rights", "admin", "chat not found", "not a member")
+
+def is_chat_wide_error(error):
+    return isinstance(error, Forbidden) or any(text in str(error).lower() for text in CHAT_WIDE_DELETE_ERRORS)
+
+async def delete_batch(bot, chat_id, message_ids, limiter, deadline):
+    """Clears up to 100 IDs (newest first) in one call. Missing IDs are skipped by Telegram; on a
+    per-message BadRequest (e.g. a message too old to delete) the batch is split so the rest still
+    go through. Chat-wide errors (no delete rights, bot removed) are raised: smaller batches cannot help.
+    Returns how many IDs were covered by successful calls."""
+    try:
+        await call_with_retry(limiter, bot.delete_messages, chat_id, message_ids)
+        return len(message_ids)
+    except BadRequest as e:
+        if is_chat_wide_error(e):
+            raise
+        if len(message_ids) == 1 or time.monotonic() > deadline:
+            return 0
+        middle = len(message_ids) // 2
+        newer = await delete_batch(bot, chat_id, message_ids[:middle], limiter, deadline)
+        # Messages only get harder to delete with age: if none of the newer half went, the older half won't
+        if not newer and middle > 1:
+            return 0
+        return newer + await delete_batch(bot, chat_id, message_ids[middle:], limiter, deadline)
+
+class ProgressMessage:
+    """Edits one status message in place, at most every PROGRESS_EDIT_INTERVAL seconds."""
+
+    def __init__(self, message, template, total):
+        self.message = message
+        self.template = template
+        self.total = total
+        self._last_edit = time.monotonic()
+
+    async def update(self, processed, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_edit < PROGRESS_EDIT_INTERVAL:
+            return
+        self._last_edit = now
+        try:
+            await self.message.edit_text(self.template.format(processed=processed, total=self.total))
+        except TelegramError:
+            pass  # progress is best effort: a failed edit must not abort the bulk job
+
+# === REPORTS ===
+def wants_csv(context):
+    return bool(context.args) and context.args[0].lower() == "csv"
+
+def _tg_len(text):
+    # Telegram counts message length in UTF-16 code units
+    return len(text.encode("utf-16-le")) // 2
+
+def _split_item(text, limit):
+    """Breaks an item longer than a page at line boundaries."""
+    chunk = []
+    size = 0
+    for line in text.split("\n"):
+        if chunk and size + _tg_len(line) + 1 > limit:
+            yield "\n".join(chunk)
+            chunk, size = [], 0
+        chunk.append(line)
+        size += _tg_len(line) + 1
+    if chunk:
+        yield "\n".join(chunk)
+
+async def send_report(message, header, items, empty_text=None, csv_header=None, csv_name="report.csv"):
+    """Sends a report as replies to `message`, paginated under Telegram's message limit.
+
+    `items` is an async iterable of (html_text, csv_rows). Pages go out as soon as they fill, with at
+    most REPORT_SEND_CONCURRENCY in flight, so memory stays flat whatever the report size. With
+    `csv_header`, every csv row is also written to a document sent after the last page.
+    Returns the number of items rendered."""
+    limiter = message_limiter(message.chat_id)
+    in_flight = asyncio.Semaphore(REPORT_SEND_CONCURRENCY)
+    sends = []
+    csv_file = csv_text = csv_writer = None
+    if csv_header:
+        import csv, tempfile  # only CSV exports need them
+        csv_file = tempfile.SpooledTemporaryFile(max_size=REPORT_CSV_SPOOL)
+        csv_text = io.TextIOWrapper(csv_file, encoding="utf-8", newline="")
+        csv_writer = csv.writer(csv_text)
+        csv_writer.writerow(csv_header)
+
+    async def send(text):
+        try:
+            await call_with_retry(limiter, message.reply_text, text, parse_mode="HTML")
+        finally:
+            in_flight.release()
+
+    page_number = 1
+    page_header = header
+    page, page_size = [], _tg_len(header)
+    limit = REPORT_PAGE_LIMIT - _tg_len(header) - 16
+
+    async def flush_page():
+        nonlocal page_number, page_header, page, page_size
+        await in_flight.acquire()
+        body = "\n".join(page)
+        sends.append(asyncio.ensure_future(send(f"{page_header}\n\n{body}" if page_header else body)))
+        page_number += 1
+        page_header = f"{header} (page {page_number})".strip()
+        page, page_size = [], _tg_len(page_header)
+
+    count = 0
+    try:
+        async for text, csv_rows in items:
+            count += 1
+            if csv_writer and csv_rows:
+                csv_writer.writerows(csv_rows)
+            size = _tg_len(text)
+            for piece in ([text] if size <= limit else _split_item(text, limit)):
+                piece_size = size if piece is text else _tg_len(piece)
+                if page and page_size + piece_size + 1 > REPORT_PAGE_LIMIT:
+                    await flush_page()
+                page.append(piece)
+                page_size += piece_size + 1
+        if not count and empty_text:
+            await message.reply_text(empty_text)
+            return 0
+        if page:
+            await flush_page()
+        await asyncio.gather(*sends)
+        if csv_writer:
+            csv_text.flush()
+            csv_file.seek(0)
+            await call_with_retry(limiter, message.reply_document, document=csv_file, filename=csv_name)
+    finally:
+        for task in sends:
+            task.cancel()
+        if csv_text:
+            csv_text.close()
+    return count
+
+async def agroupby(aiterable, key):
+    """Async counterpart of itertools.groupby that yields (key, list_of_items)."""
+    group, group_key = [], None
+    async for item in aiterable:
+        item_key = key(item)
+        if group and item_key != group_key:
+            yield group_key, group
+            group = []
+        group_key = item_key
+        group.append(item)
+    if group:
+        yield group_key, group
+
+async def aenumerate(aiterable, start=0):
+    index = start
+    async for item in aiterable:
+        yield index, item
+        index += 1
+
+# === REPLY BATCHING ===
+class ReplyBatcher:
+    """Collects per-chat confirmation lines and sends them as one message per window.
+
+    The first line in a chat starts a REPLY_BATCH_WINDOW timer; reaching REPLY_BATCH_MAX
+    lines sends right away in the background, so the handler that added the line never waits
+    on the chat's message bucket. Sends go through that bucket, like report pages."""
+
+    def __init__(self, window=REPLY_BATCH_WINDOW, max_batch=REPLY_BATCH_MAX):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}
+        self._timers = {}
+
+    async def add(self, bot, chat_id, line):
+        lines = self._pending.setdefault(chat_id, [])
+        lines.append(line)
+        if len(lines) >= self.max_batch:
+            # Anything in _timers has not started sending yet (flush pops itself first), so replacing it is safe
+            timer = self._timers.get(chat_id)
+            if timer:
+                timer.cancel()
+            self._timers[chat_id] = asyncio.ensure_future(self.flush(bot, chat_id))
+        elif chat_id not in self._timers:
+            self._timers[chat_id] = asyncio.ensure_future(self._flush_later(bot, chat_id))
+
+    async def _flush_later(self, bot, chat_id):
+        await asyncio.sleep(self.window)
+        self._timers.pop(chat_id, None)
+        await self.flush(bot, chat_id)
+
+    async def flush(self, bot, chat_id, retry=True):
+        """Sends what is pending. Never raises: a page Telegram rejects is dropped, and on network
+        errors, timeouts and flood waits past the retries the unsent pages are requeued for the
+        next window unless `retry` is False. Any other error (the bot was removed, the group
+        migrated) drops the rest, since resending can never succeed."""
+        timer = self._timers.pop(chat_id, None)
+        if timer and timer is not asyncio.current_task():
+            timer.cancel()
+        lines = self._pending.pop(chat_id, None)
+        if not lines:
+            return
+        limiter = message_limiter(chat_id)
+        pages = list(_split_item("\n".join(lines), REPORT_PAGE_LIMIT))
+        for index, text in enumerate(pages):
+            try:
+                await call_with_retry(limiter, bot.send_message, chat_id=chat_id, text=text, parse_mode="HTML")
+            except BadRequest as e:
+                print(f"Dropped a page of confirmations in chat {chat_id}: {e}")
+            except TelegramError as e:
+                unsent = pages[index:]
+                if not retry or not isinstance(e, (NetworkError, RetryAfter)):
+                    print(f"Dropped {len(unsent)} pages of confirmations in chat {chat_id}: {e}")
+                    return
+                # The users behind these lines are already marked done; resending "done" won't bring them back
+                print(f"Requeued {len(unsent)} pages of confirmations in chat {chat_id}: {e}")
+                self._pending[chat_id] = unsent + self._pending.get(chat_id, [])
+                if chat_id not in self._timers:
+                    self._timers[chat_id] = asyncio.ensure_future(self._flush_later(bot, chat_id))
+                return
+
+    async def flush_all(self, bot):
+        await asyncio.gather(*(self.flush(bot, chat_id, retry=False) for chat_id in list(self._pending)))
+
+reply_batcher = ReplyBatcher()
+
+# === SAFELIST COMMANDS ===
+@admin_only
+async def save_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    if not update.message.reply_to_message:
+        await update.message.reply_text("⚠️ Reply to a user's message to add them to the safelist.")
+        return
+    target_user = update.message.reply_to_message.from_user
+    await storage.add_whitelist(effective_chat_id, str(target_user.id))
+    chat_states.whitelist_added(effective_chat_id, str(target_user.id))
+    await update.message.reply_text(f"✅ {tg_mention(target_user.full_name, target_user.id)} has been added to the safelist.", parse_mode="HTML")
+
+@admin_only
+async def unsave_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    if not update.message.reply_to_message:
+        await update.message.reply_text("⚠️ Reply to a user's message to remove them from the safelist.")
+        return
+    target_user = update.message.reply_to_message.from_user
+    await storage.remove_whitelist(effective_chat_id, str(target_user.id))
+    chat_states.whitelist_removed(effective_chat_id, str(target_user.id))
+    await update.message.reply_text(f"🗑️ {tg_mention(target_user.full_name, target_user.id)} has been removed from the safelist.", parse_mode="HTML")
+
+@admin_only
+async def list_saved_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    whitelist = await chat_states.whitelist(effective_chat_id)
+    if not whitelist:
+        await update.message.reply_text("📝 The safelist is empty.")
+        return
+    roster = await chat_states.roster(effective_chat_id)
+    msg = "📝 **Safelisted Users:**\n\n"
+    for idx, tg_user in enumerate(sorted(whitelist), 1):
+        entry = roster.get(tg_user)
+        name = entry.name if entry else f"ID: {tg_user}"
+        msg += f"{idx}. {tg_mention(name, tg_user)}\n"
+    await update.message.reply_text(msg, parse_mode="HTML")
+
+# === CORE COMMANDS ===
+@admin_only
+async def open(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    # A new session must not start while the previous one's links are still being deleted
+    await session_teardown.wait(effective_chat_id)
+    await chat_states.update_session(effective_chat_id, phase="links", deadline=None, opened_at=utc_now(), closed_at=None, deadline_chat=None)
+    cancel_deadline(context.job_queue, effective_chat_id)
+    chat = update.effective_chat
+    await enable_chat(chat)
+    if "[OPEN]" not in chat.title:
+        new_title = chat.title.replace("[CLOSED]", "").strip() + " [OPEN]"
+        await chat.set_title(new_title)
+    await context.bot.send_animation(chat.id, animation=OPEN_GIF_FILE_ID)
+    message_text = "<b>🚀 Start dropping your post links!</b>"
+    try:
+        sent_message = await context.bot.send_message(chat_id=chat.id, text=message_text, parse_mode="HTML")
+        await context.bot.pin_chat_message(chat_id=chat.id, message_id=sent_message.message_id)
+    except BadRequest as e:
+        error_text = "⚠️ Could not pin message. Please grant 'Pin Messages' admin rights." if "rights" in str(e).lower() else "⚠️ An error occurred while pinning the message."
+        await context.bot.send_message(chat_id=chat.id, text=error_text, parse_mode="HTML")
+
+@admin_only
+async def users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await write_queue.flush()
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    await session_teardown.wait(effective_chat_id)
+    total_unique = await storage.count_link_users(effective_chat_id)
+    await update.message.reply_text(f"📊 **Total unique users:** {total_unique}")
+
+@admin_only
+async def multiple_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await write_queue.flush()
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    await session_teardown.wait(effective_chat_id)
+
+    async def items():
+        count_multi = 0
+        yield "🔗 **Multiple Links by Same User**:\n", None
+        rows = storage.stream_multiple_links(effective_chat_id)
+        async for (tg_user, tg_name), links in agroupby(rows, key=lambda row: (row[0], row[1])):
+            if len(links) > 1:
+                count_multi += 1
+                block = f"{count_multi}. 🙍🏻‍♂️ {tg_mention(tg_name, tg_user)}\n"
+                for idx, (_, _, tw_user, link) in enumerate(links, 1):
+                    block += f"    {idx}. 𝕏 <a href='{link}'>@{tw_user}</a>\n"
+                yield block, [("multiple", *row) for row in links]
+        if count_multi == 0:
+            yield "✅ No user shared multiple links.\n", None
+
+        count_fraud = 0
+        yield "🚨 **Fraud (Same X Username by Different Users)**:\n", None
+        rows = storage.stream_fraud_links(effective_chat_id)
+        async for tw_user, tg_list in agroupby(rows, key=lambda row: row[2]):
+            count_fraud += 1
+            block = f"{count_fraud}. 𝕏 @{tw_user}\n"
+            for i, (tg_user, tg_name, _, link) in enumerate(tg_list, 1):
+                block += f"    {i}. 🙍🏻‍♂️ {tg_mention(tg_name, tg_user)} → <a href='{link}'>Link</a>\n"
+            yield block, [("fraud", *row) for row in tg_list]
+        if count_fraud == 0:
+            yield "✅ No fraud cases found.", None
+
+    csv_header = ("section", "telegram_user", "telegram_name", "twitter_user", "link") if wants_csv(context) else None
+    await send_report(update.message, "", items(), csv_header=csv_header, csv_name="multiple_links.csv")
+
+@admin_only
+async def unsafe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await write_queue.flush()
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    await session_teardown.wait(effective_chat_id)
+
+    async def items():
+        async for idx, (tg_user, name, tw_user, link) in aenumerate(storage.stream_roster(effective_chat_id, "unsafe"), 1):
+            yield f"{idx}. 🙍🏻‍♂️ {tg_mention(name or 'Unknown', tg_user)} → 𝕏 @{tw_user}", [(tg_user, name, tw_user, link)]
+
+    csv_header = ("telegram_user", "telegram_name", "twitter_user", "link") if wants_csv(context) else None
+    await send_report(update.message, "⚠️ **Unsafe users:**", items(), "✅ All users are safe.", csv_header, "unsafe.csv")
+
+@admin_only
+async def list_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await write_queue.flush()
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+
+    async def items():
+        async for idx, (tg_user, name, tw_user, link) in aenumerate(stream_latest_links(effective_chat_id), 1):
+            yield f"{idx}. 🙍🏻‍♂️ {tg_mention(name, tg_user)} → 𝕏 @{tw_user}", [(tg_user, name, tw_user, link)]
+
+    csv_header = ("telegram_user", "telegram_name", "twitter_user", "link") if wants_csv(context) else None
+    await send_report(update.message, "📋 **User List:**", items(), "• No users have shared links yet.", csv_header, "users.csv")
+
+@admin_only
+async def get_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await write_queue.flush()
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    if update.message.reply_to_message:
+        target_user = update.message.reply_to_message.from_user
+        main = await get_main_link(effective_chat_id, str(target_user.id))
+        if main:
+            msg = f"🔗 Link for {tg_mention(target_user.full_name, target_user.id)}:\n<a href='{main[1]}'>@{main[0]}</a>"
+        else:
+            msg = f"⚠️ No link found for {tg_mention(target_user.full_name, target_user.id)}."
+        await update.message.reply_text(msg, parse_mode="HTML")
+        return
+
+    async def items():
+        async for idx, (tg_user, name, tw_user, link) in aenumerate(stream_latest_links(effective_chat_id), 1):
+            yield f"{idx}. 🙍🏻‍♂️ {tg_mention(name, tg_user)} → 𝕏 <a href='{link}'>@{tw_user}</a>", [(tg_user, name, tw_user, link)]
+
+    csv_header = ("telegram_user", "telegram_name", "twitter_user", "link") if wants_csv(context) else None
+    await send_report(update.message, "📋 **User Links:**", items(), "• No links found.", csv_header, "links.csv")
+
+@admin_only
+async def clean_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    count = int(context.args[0]) if context.args and context.args[0].isdigit() else CLEAN_DEFAULT_COUNT
+    count = min(count, CLEAN_MAX_COUNT)
+    chat_id = update.effective_chat.id
+    command_message_id = update.message.message_id
+    message_ids = list(range(command_message_id, max(command_message_id - count - 1, 0), -1))
+    chunks = [message_ids[i:i + CLEAN_BATCH_SIZE] for i in range(0, len(message_ids), CLEAN_BATCH_SIZE)]
+    limiter = chat_limiter(chat_id)
+    semaphore = asyncio.Semaphore(CLEAN_CONCURRENCY)
+    started = time.monotonic()
+    deadline = started + CLEAN_TIME_BUDGET
+    skipped = 0
+    stopped_by = None
+
+    async def delete_chunk(chunk):
+        nonlocal skipped, stopped_by
+        async with semaphore:
+            if stopped_by or time.monotonic() > deadline:
+                skipped += len(chunk)
+                return 0
+            try:
+                cleared = await delete_batch(context.bot, chat_id, chunk, limiter, deadline)
+            except (BadRequest, Forbidden) as e:  # chat-wide, see delete_batch
+                stopped_by = stopped_by or str(e)
+                skipped += len(chunk)
+                return 0
+            if not cleared and time.monotonic() <= deadline:
+                # Chunks run newest first, so every older one would fail the same way
+                stopped_by = stopped_by or "no message in this range could be deleted (older than 48h, or no delete rights)"
+            return cleared
+
+    # Telegram does not say which IDs existed, so this counts IDs cleared, not messages deleted
+    cleared = sum(await asyncio.gather(*(delete_chunk(chunk) for chunk in chunks)))
+    elapsed = time.monotonic() - started
+    if stopped_by:
+        text = f"⚠️ Cleaning stopped: {stopped_by}. {cleared} message IDs cleared before that."
+    else:
+        text = f"✅️ Chat cleaned. {cleared} message IDs cleared in {elapsed:.1f}s ({cleared / max(elapsed, 0.001):.0f} IDs/s)."
+        if skipped:
+            text += f"\n⏱ Time budget reached, {skipped} older message IDs were left. Run /clean again to continue."
+    confirmation_msg = await context.bot.send_message(chat_id=chat_id, text=text)
+    context.job_queue.run_once(delete_message_job, 5, data={'chat_id': chat_id, 'message_id': confirmation_msg.message_id})
+
+async def track_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.message or not update.effective_chat: return
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    current_phase = await chat_states.phase(effective_chat_id)
+    user = update.message.from_user
+    parts = (update.message.text, update.message.caption)
+    
+    if current_phase == "links":
+        for twitter_user, full_link in extract_links(parts):
+            await write_queue.enqueue("links", "insert_link", (effective_chat_id, str(user.id), user.full_name, twitter_user, full_link))
+            chat_states.record_link(effective_chat_id, str(user.id), user.full_name, twitter_user, full_link)
+    elif current_phase == "done":
+        completed = await chat_states.completed(effective_chat_id)
+        # Repeat "done" messages from users already marked complete cost nothing
+        if str(user.id) not in completed and is_done_message(parts):
+            completed.add(str(user.id))
+            await write_queue.enqueue("status", "mark_done", (effective_chat_id, str(user.id)))
+            main = await get_main_link(effective_chat_id, str(user.id))
+            line = f"✅️ {tg_mention(user.full_name, user.id)} 𝕏 :- @{main[0]}" if main else f"⚠️ {tg_mention(user.full_name, user.id)} No link shared"
+            await reply_batcher.add(context.bot, update.effective_chat.id, line)
+
+@admin_only
+async def set_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    if not context.args:
+        await update.message.reply_text("**Usage:** `/set <link>`\n**Example:** `/set x.com/your_user`")
+        return
+    new_link = context.args[0]
+    await storage.set_tracking_link(effective_chat_id, new_link)
+    await update.message.reply_text(f"✅ Tracking link set to: `{new_link}`", parse_mode="MarkdownV2")
+
+@admin_only
+async def tracking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    import pytz  # imported on first /tracking, not at startup
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    ist_tz = pytz.timezone('Asia/Kolkata')
+    deadline_time = datetime.now(ist_tz) + timedelta(hours=DEADLINE_HOURS)
+    deadline_str = deadline_time.strftime("%I:%M %p IST")
+    deadline = deadline_time.astimezone(timezone.utc).isoformat(timespec="seconds")
+    chat = update.effective_chat
+    await chat_states.update_session(effective_chat_id, phase="done", deadline=deadline, deadline_chat=chat.id)
+    schedule_deadline(context.job_queue, effective_chat_id, chat.id, deadline)
+    if "[OPEN]" in chat.title:
+        await chat.set_title(chat.title.replace("[OPEN]", "[CLOSED]"))
+    elif "[CLOSED]" not in chat.title:
+        await chat.set_title(chat.title.strip() + " [CLOSED]")
+    await enable_chat(chat)
+    tracking_link = await storage.get_tracking_link(effective_chat_id) or DEFAULT_TRACKING_LINK
+
+    message_text = (
+        " Timeline Updated 👇\n\n"
+        f" {tracking_link}\n\n"
+        "Like all posts of the TL account and\n"
+        "Drop 'done' (or 'ad', 'completed') to be marked safe ✅\n\n"
+        f"⚠️ DEADLINE: {deadline_str}"
+    )
+    try:
+        sent_message = await context.bot.send_message(chat_id=chat.id, text=message_text, disable_web_page_preview=False)
+        await context.bot.pin_chat_message(chat_id=chat.id, message_id=sent_message.message_id)
+    except BadRequest as e:
+        error_text = "⚠️ Could not pin message. Please grant 'Pin Messages' admin rights." if "rights" in str(e).lower() else "⚠️ An error occurred while pinning the message."
+        await context.bot.send_message(chat_id=chat.id, text=error_text, parse_mode="HTML")
+
+@admin_only
+async def mark_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    if not update.message.reply_to_message:
+        await update.message.reply_text("⚠️ Please use this command by replying to a user's message.")
+        return
+    target_user = update.message.reply_to_message.from_user
+    await write_queue.enqueue("status", "mark_done", (effective_chat_id, str(target_user.id)))
+    chat_states.mark_completed(effective_chat_id, str(target_user.id))
+    main = await get_main_link(effective_chat_id, str(target_user.id))
+    reply_text = f"✅️ Manually marked {tg_mention(target_user.full_name, target_user.id)} as done."
+    if main:
+        reply_text += f"\n𝕏 :- @{main[0]}"
+    await update.message.reply_text(reply_text, parse_mode="HTML")
+
+@admin_only
+async def sr(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    if not update.message.reply_to_message:
+        await update.message.reply_text("⚠️ Reply to a user's message to add them to the SR list.")
+        return
+    user = update.message.reply_to_message.from_user
+    await storage.add_sr(effective_chat_id, str(user.id), user.full_name)
+    chat_states.sr_added(effective_chat_id, str(user.id), user.full_name)
+    await update.message.reply_text(f"⚠️ {tg_mention(user.full_name, user.id)} your likes are not visible.\nSend a screen recording with a visible profile.", parse_mode="HTML")
+
+@admin_only
+async def srlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    pending = await chat_states.srlist(effective_chat_id)
+    if not pending:
+        await update.message.reply_text("✅ SR list is empty.")
+        return
+    msg = "📹 **SR List (pending recordings):**\n\n"
+    for idx, (tg_user, name) in enumerate(pending.items(), 1):
+        msg += f"{idx}. 🙍🏻‍♂️ {tg_mention(name, tg_user)}\n"
+    await update.message.reply_text(msg, parse_mode="HTML")
+
+async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.message or not update.effective_chat: return
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    user = update.message.from_user
+    is_in_srlist = str(user.id) in await chat_states.srlist(effective_chat_id)
+    await write_queue.enqueue("status", "mark_done", (effective_chat_id, str(user.id)))
+    chat_states.mark_completed(effective_chat_id, str(user.id))
+    if is_in_srlist:
+        await storage.remove_sr(effective_chat_id, str(user.id))
+        chat_states.sr_removed(effective_chat_id, str(user.id))
+        await update.message.reply_text("✅ Screen recording received. You are marked as 'done' and removed from the SR list.")
+    else:
+        main = await get_main_link(effective_chat_id, str(user.id))
+        line = f"✅️ {tg_mention(user.full_name, user.id)} 𝕏 :- @{main[0]}" if main else f"✅️ {tg_mention(user.full_name, user.id)} Marked as done."
+        await reply_batcher.add(context.bot, update.effective_chat.id, line)
+
+@admin_only
+async def muteall(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await write_queue.flush()
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    await session_teardown.wait(effective_chat_id)
+    duration_str = context.args[0] if context.args else None
+    until_timestamp = None
+    if duration_str:
+        match = re.match(r"(\d+)([dhm])", duration_str.lower())
+        if match:
+            value, unit = int(match.group(1)), match.group(2)
+            delta = {'d': timedelta(days=value), 'h': timedelta(hours=value), 'm': timedelta(minutes=value)}.get(unit)
+            if delta:
+                until_timestamp = int((datetime.utcnow() + delta).timestamp())
+        else:
+            await update.message.reply_text("⚠️ Invalid duration format. Use 1d, 2h, 30m etc.")
+            return
+    await mute_roster(context.bot, context.job_queue, update.effective_chat.id, effective_chat_id, update.message.reply_text, until_timestamp, duration_str)
+
+async def mute_roster(bot, job_queue, chat_id, effective_chat_id, send, until_timestamp=None, duration_str=None):
+    """Mutes the session's muteable roster (unsafe + SR list, minus the safelist) in `chat_id`.
+    Status and summary messages go through `send(text, **kwargs)`; shared by /muteall and the deadline job."""
+    names = {tg_user: name async for tg_user, name, _, _ in storage.stream_roster(effective_chat_id, "muteable")}
+    final_users_to_mute = list(names)
+    if not final_users_to_mute:
+        await send("✅ No users to mute.")
+        return
+    status_message = await send(f"🔇 Muting {len(final_users_to_mute)} users...")
+    progress = ProgressMessage(status_message, "🔇 Muting users... {processed}/{total}", len(final_users_to_mute))
+    permissions = ChatPermissions(can_send_messages=False)
+
+    async def mute(tg_user):
+        await bot.restrict_chat_member(chat_id, int(tg_user), permissions, until_date=until_timestamp)
+
+    muted, failed = await run_bulk(final_users_to_mute, mute, chat_limiter(chat_id), on_progress=progress.update)
+    await progress.update(len(final_users_to_mute), force=True)
+    job_queue.run_once(delete_message_job, 5, data={'chat_id': chat_id, 'message_id': status_message.message_id})
+    muted_list_msgs = [f"🙍🏻‍♂️ {tg_mention(names[tg_user] or f'ID: {tg_user}', tg_user)}" for tg_user in muted]
+    msg = "🔇 **Muted users (unsafe + SR list):**\n\n" + "\n".join(muted_list_msgs)
+    if duration_str: msg += f"\n\n⏱ **Duration:** {duration_str}"
+    if failed: msg += "\n\n❌ **Failed to mute:**\n" + "\n".join([f"- {tg} ({err})" for tg, err in failed])
+    # One line per user: hundreds of them overflow a single message
+    for text in _split_item(msg, REPORT_PAGE_LIMIT):
+        await call_with_retry(message_limiter(chat_id), send, text, parse_mode="HTML")
+
+# === DEADLINE JOBS ===
+def deadline_job_name(effective_chat_id):
+    return f"deadline:{effective_chat_id}"
+
+def cancel_deadline(job_queue, effective_chat_id):
+    for job in job_queue.get_jobs_by_name(deadline_job_name(effective_chat_id)):
+        job.schedule_removal()
+
+def schedule_deadline(job_queue, effective_chat_id, chat_id, deadline):
+    """Runs deadline_job at `deadline` (UTC ISO string) plus this chat's stagger offset; replaces any earlier job.
+    A deadline that passed while the bot was down fires right away (plus the offset)."""
+    cancel_deadline(job_queue, effective_chat_id)
+    when = max(datetime.fromisoformat(deadline), datetime.now(timezone.utc)) + timedelta(seconds=abs(chat_id) % DEADLINE_STAGGER)
+    job_queue.run_once(
+        deadline_job, when, name=deadline_job_name(effective_chat_id),
+        data={'chat_id': chat_id, 'effective_chat_id': effective_chat_id, 'deadline': deadline}
+    )
+
+async def deadline_job(context: ContextTypes.DEFAULT_TYPE):
+    job_data = context.job.data
+    chat_id, effective_chat_id = job_data['chat_id'], job_data['effective_chat_id']
+    session = await chat_states.session(effective_chat_id)
+    if session.phase != "done" or session.deadline != job_data['deadline']:
+        return  # closed, reopened or re-tracked since this job was scheduled
+    # Cleared first so a restart mid-mute does not mute the same session twice
+    await chat_states.update_session(effective_chat_id, deadline=None, deadline_chat=None)
+    await write_queue.flush()
+    await session_teardown.wait(effective_chat_id)
+    await context.bot.send_message(chat_id=chat_id, text="⏰ Deadline reached. Muting unsafe users...")
+    await mute_roster(context.bot, context.job_queue, chat_id, effective_chat_id, partial(context.bot.send_message, chat_id))
+
+async def restore_deadlines(job_queue):
+    for effective_chat_id, deadline, chat_id in await storage.pending_deadlines():
+        if owns_chat(effective_chat_id):
+            schedule_deadline(job_queue, effective_chat_id, chat_id or effective_chat_id, deadline)
+
+@admin_only
+async def close_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await write_queue.flush()
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    closed_at = utc_now()
+    session = await chat_states.session(effective_chat_id)
+    await session_teardown.close(effective_chat_id, session.opened_at, closed_at)
+    chat_states.session_closed(effective_chat_id)
+    # Persisted before the Telegram calls: if one of them fails the session is still closed and no deadline fires
+    await chat_states.update_session(effective_chat_id, phase=DEFAULT_PHASE, deadline=None, closed_at=closed_at, deadline_chat=None)
+    cancel_deadline(context.job_queue, effective_chat_id)
+    chat = update.effective_chat
+    await disable_chat(chat)
+    new_title = chat.title.replace("[OPEN]", "").replace("[CLOSED]", "").strip() + " [CLOSED]"
+    await chat.set_title(new_title)
+    await update.message.reply_text("🗑️ **Session closed. All data cleared!** 🔒 Chat is now OFF.")
+
+@admin_only
+async def history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    effective_chat_id = await get_effective_chat_id(update.effective_chat.id)
+    rows = await storage.session_history(effective_chat_id)
+    if not rows:
+        await update.message.reply_text("📜 No closed sessions yet.")
+        return
+    msg = "📜 **Recent sessions:**\n\n"
+    for idx, (opened_at, closed_at, participants, links, completed, sr_pending) in enumerate(rows, 1):
+        msg += f"{idx}. {(opened_at or '?')[:16]} → {(closed_at or '?')[:16]} UTC: {participants} users, {links} links, {completed} done, {sr_pending} SR\n"
+    await update.message.reply_text(msg)
+
+@admin_only
+async def lock_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await disable_chat(update.effective_chat)
+    await update.message.reply_text("🔒 Chat is now OFF. Wait for TL update.")
+
+# === GROUP CONNECTION COMMANDS ===
+@admin_only
+async def connect_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    if not context.args:
+        await update.message.reply_text("Usage: `/connect <target_group_id>`", parse_mode="MarkdownV2")
+        return
+    try:
+        target_chat_id = int(context.args[0])
+        if target_chat_id > 0:
+            await update.message.reply_text("⚠️ Error: Target ID must be a valid group ID (e.g., -100123456).")
+            return
+    except (ValueError, IndexError):
+        await update.message.reply_text("⚠️ Invalid Target Group ID. It must be a number.")
+        return
+    await save_group_connection(chat_id, target_chat_id)
+    await update.message.reply_text(f"🔗 This group's data is now connected to group ` {target_chat_id}`.", parse_mode="HTML")
+
+@admin_only
+async def disconnect_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    await save_group_connection(chat_id, None)
+    await update.message.reply_text("🔌 This group is now disconnected and will use its own local data.")
+
+@admin_only
+async def connection_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    await connection_cache.resolve(chat_id)
+    target_chat_id = connection_cache.target(chat_id)
+    if target_chat_id is not None:
+        await update.message.reply_text(f"🔗 This group shares data with group ` {target_chat_id}`.", parse_mode="HTML")
+    else:
+        await update.message.reply_text("🏠 This group is using its own local data.")
+
+# === DIAGNOSTICS ===
+@admin_only
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    profiler = metrics.profiler
+    action = context.args[0].lower() if context.args else ""
+    if action == "on":
+        if not profiler.start():
+            await update.message.reply_text("⚠️ Profiler is already running.")
+            return
+        await update.message.reply_text("🔬 Profiler started. Send /profile off to stop it and get the report.")
+    elif action == "off":
+        if not profiler.stop():
+            await update.message.reply_text("⚠️ Profiler is not running.")
+            return
+        elapsed = time.monotonic() - profiler.started_at
+        total = sum(profiler.samples.values())
+        msg = f"🔬 **Profile:** {total} samples in {elapsed:.0f}s\n\n"
+        for frame, count in profiler.top():
+            msg += f"{count * 100 / max(total, 1):5.1f}%  {frame}\n"
+        await update.message.reply_text(msg)
+        if total:
+            await update.message.reply_document(document=profiler.collapsed().encode(), filename="profile.folded")
+    else:
+        state = "running" if profiler.running else "stopped"
+        await update.message.reply_text(f"Usage: /profile on|off (profiler is {state})")
+
+# === LIFECYCLE ===
+metrics_server = None
+
+async def on_startup(application: Application):
+    """Runs before the first update is fetched; `metrics.startup` times each step from process start."""
+    global metrics_server
+    await storage.connect()
+    metrics.startup.mark("storage")
+    await connection_cache.load()
+    await session_teardown.resume()
+    await restore_deadlines(application.job_queue)
+    metrics_server = await metrics.start_server()
+    metrics.startup.mark("ready")
+    schema = f", schema v{storage.schema_version}" if storage.schema_version is not None else ""
+    if storage.migrated_from not in (None, storage.schema_version):
+        schema += f" (migrated from v{storage.migrated_from})"
+    print(f"Startup: {metrics.startup.summary()}{schema}")
+
+async def flush_replies_on_stop(application: Application):
+    await reply_batcher.flush_all(application.bot)
+
+async def flush_writes_on_shutdown(application: Application):
+    metrics.profiler.stop()
+    if metrics_server:
+        metrics_server.close()
+    await write_queue.flush()
+    await session_teardown.stop()
+    await storage.close()
+
+# === MAIN FUNCTION ===
+def get_bot_token():
+    BOT_TOKEN = os.getenv("BOT_TOKEN") or "8374636357:AAFfnTJxR7P33lpsPHoOjclZTR1igKhXaNw" 
+    if BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
+        print("ERROR: Please replace 'YOUR_BOT_TOKEN_HERE' with your actual bot token.")
+        return None
+    return BOT_TOKEN
+
+def build_application(builder, token):
+    """Registers every handler on an application built from `builder` (polling or webhook)."""
+    app = (
+        builder.token(token)
+        .request(metrics.InstrumentedRequest())
+        .post_init(on_startup)
+        .post_stop(flush_replies_on_stop)
+        .post_shutdown(flush_writes_on_shutdown)
+        .build()
+    )
+    app.job_queue.run_repeating(flush_writes_job, interval=WRITE_FLUSH_INTERVAL, first=WRITE_FLUSH_INTERVAL)
+    app.job_queue.run_repeating(evict_idle_chats_job, interval=CHAT_STATE_SWEEP, first=CHAT_STATE_SWEEP)
+
+    # Register all handlers
+    app.add_handler(CommandHandler("open", open))
+    app.add_handler(CommandHandler("tracking", tracking))
+    app.add_handler(CommandHandler("close", close_session))
+    app.add_handler(CommandHandler("history", history))
+    app.add_handler(CommandHandler("l", lock_chat))
+    app.add_handler(CommandHandler("users", users))
+    app.add_handler(CommandHandler("list", list_users))
+    app.add_handler(CommandHandler("link", get_links))
+    app.add_handler(CommandHandler("unsafe", unsafe))
+    app.add_handler(CommandHandler("multiple_link", multiple_link))
+    app.add_handler(CommandHandler("muteall", muteall))
+    app.add_handler(CommandHandler("clean", clean_chat))
+    app.add_handler(CommandHandler("sr", sr))
+    app.add_handler(CommandHandler("srlist", srlist))
+    app.add_handler(CommandHandler("ad", mark_done))
+    app.add_handler(CommandHandler("save", save_user))
+    app.add_handler(CommandHandler("unsave", unsave_user))
+    app.add_handler(CommandHandler("savelist", list_saved_users))
+    app.add_handler(CommandHandler("set", set_link))
+    app.add_handler(CommandHandler("connect", connect_group))
+    app.add_handler(CommandHandler("disconnect", disconnect_group))
+    app.add_handler(CommandHandler("connection_status", connection_status))
+    app.add_handler(CommandHandler("profile", profile))
+
+    # Admin-status cache invalidation
+    app.add_handler(ChatMemberHandler(track_member_updates, ChatMemberHandler.ANY_CHAT_MEMBER))
+
+    # Message handlers
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, track_message))
+    app.add_handler(MessageHandler(filters.VIDEO, handle_video))
+
+    # Latency and DB-call metrics for every handler above
+    metrics.instrument_application(app)
+    return app
+
+def main():
+    BOT_TOKEN = get_bot_token()
+    if not BOT_TOKEN:
+        return
+
+    app = build_application(Application.builder().concurrent_updates(CONCURRENT_UPDATES), BOT_TOKEN)
+
+    print("Bot is running...")
+    app.run_polling(allowed_updates=Update.ALL_TYPES)
+
+metrics.startup.mark("imported")
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,354 @@
+"""In-process metrics for the bot, served in the Prometheus text format.
+
+    curl -s localhost:9108/metrics
+
+What is recorded:
+    bot_handler_seconds{handler}          latency of every registered handler callback
+    bot_handler_errors_total{handler}     handler calls that raised
+    bot_db_query_seconds{query}           latency of every Storage query method
+    bot_db_queries_per_update             Storage calls made while handling one update
+    bot_telegram_api_seconds{method}      Bot API request latency
+    bot_telegram_flood_waits_total{method} Bot API requests answered with 429 (RetryAfter)
+    bot_write_queue_depth                 writes buffered in the write-behind queue
+    bot_write_dead_letters                writes set aside after failing for good (bot1.WriteBehindQueue)
+    bot_chat_states                       chats whose state is held in memory (bot1.ChatStateCache)
+    bot_cache_lookups_total{cache,result} lookups in bot1's in-memory caches; result "miss" went to storage
+                                          or the Bot API (connections also split hits into connected/direct)
+    bot_cache_evictions_total{cache,reason} entries dropped from those caches (size, idle, expired)
+    bot_startup_seconds{phase}            seconds from process start to each startup milestone (StartupTimer)
+
+BOT_METRICS_PORT picks the port (0 disables the endpoint); it only listens on 127.0.0.1.
+SamplingProfiler backs the admin-only /profile command.
+"""
+import os
+import sys
+import time
+import asyncio
+import inspect
+import threading
+import contextvars
+from collections import Counter
+from functools import wraps
+from telegram.request import HTTPXRequest
+
+# === CONFIGURATION ===
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.getenv("BOT_METRICS_PORT") or 9108)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+PROFILE_INTERVAL = 0.005   # seconds between stack samples
+PROFILE_MAX_DEPTH = 40     # frames kept per sample, innermost first
+
+
+# === METRIC TYPES ===
+def _labels(names, values, le=None):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class CounterMetric:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, labels
+        self._values = Counter()
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] += amount
+
+    def total(self):
+        return sum(self._values.values())
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+class GaugeMetric:
+    """Gauge whose value is read from `fn` at scrape time."""
+
+    def __init__(self, name, help, fn):
+        self.name, self.help, self.fn = name, help, fn
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.fn()}"
+
+class HistogramMetric:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names, self.buckets = name, help, labels, buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series = {}
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        else:
+            series[len(self.buckets)] += 1
+        series[-1] += value
+
+    def total(self):
+        """Sum of all observed values across every label set."""
+        return sum(series[-1] for series in self._series.values())
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, bound)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {series[-1]:.6f}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+registry = Registry()
+handler_seconds = registry.add(HistogramMetric("bot_handler_seconds", "Handler callback latency.", ("handler",)))
+handler_errors = registry.add(CounterMetric("bot_handler_errors_total", "Handler calls that raised.", ("handler",)))
+db_query_seconds = registry.add(HistogramMetric("bot_db_query_seconds", "Storage query latency.", ("query",)))
+db_queries_per_update = registry.add(HistogramMetric("bot_db_queries_per_update", "Storage calls per handled update.", buckets=COUNT_BUCKETS))
+api_seconds = registry.add(HistogramMetric("bot_telegram_api_seconds", "Bot API request latency.", ("method",)))
+api_flood_waits = registry.add(CounterMetric("bot_telegram_flood_waits_total", "Bot API requests answered with 429.", ("method",)))
+cache_lookups = registry.add(CounterMetric("bot_cache_lookups_total", "In-memory cache lookups by cache and result.", ("cache", "result")))
+cache_evictions = registry.add(CounterMetric("bot_cache_evictions_total", "Entries dropped from in-memory caches.", ("cache", "reason")))
+
+# Storage calls made by the update currently being handled (None outside a handler)
+_update_queries = contextvars.ContextVar("update_queries", default=None)
+
+
+# === INSTRUMENTATION ===
+def instrument_handler(callback):
+    """Wraps a handler callback to time it and count the Storage calls it makes."""
+    name = callback.__name__
+
+    @wraps(callback)
+    async def wrapped(update, context):
+        if startup.mark("first_update"):
+            print(f"First update after {startup.phases['first_update']:.2f}s ({name})")
+        queries = [0]
+        token = _update_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, name)
+            db_queries_per_update.observe(queries[0])
+            _update_queries.reset(token)
+    return wrapped
+
+def instrument_application(app):
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            handler.callback = instrument_handler(handler.callback)
+
+def _count_query():
+    queries = _update_queries.get()
+    if queries is not None:
+        queries[0] += 1
+
+def _timed_query(name, method):
+    @wraps(method)
+    def wrapped(*args, **kwargs):
+        _count_query()
+        started = time.perf_counter()
+        result = method(*args, **kwargs)
+        if inspect.isasyncgen(result):
+            return _timed_stream(name, result)
+        return _timed_await(name, result, started)
+    return wrapped
+
+async def _timed_await(name, awaitable, started):
+    try:
+        return await awaitable
+    finally:
+        db_query_seconds.observe(time.perf_counter() - started, name)
+
+async def _timed_stream(name, rows):
+    """Only time spent waiting on the database counts, not the consumer's work between rows."""
+    spent = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                row = await rows.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                spent += time.perf_counter() - started
+            yield row
+    finally:
+        await rows.aclose()
+        db_query_seconds.observe(spent, name)
+
+def instrument_storage(storage, base, skip=("is_transient",)):
+    """Times every public query method that `base` (the Storage interface) defines, on this instance."""
+    for name, attr in vars(base).items():
+        if not name.startswith("_") and callable(attr) and name not in skip:
+            setattr(storage, name, _timed_query(name, getattr(storage, name)))
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records per-method latency and 429 answers."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        finally:
+            api_seconds.observe(time.perf_counter() - started, api_method)
+        if code == 429:
+            api_flood_waits.inc(api_method)
+        return code, payload
+
+
+# === STARTUP ===
+def _process_age():
+    """Seconds since this process was started (Linux /proc, 10ms resolution); 0 where unavailable."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        return max(0.0, time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+class StartupTimer:
+    """Seconds from process start to named milestones, the last one being the first handled update.
+
+    Each milestone is recorded once, so restarts inside one process (tests, bench) keep the first."""
+
+    def __init__(self):
+        self.started = time.perf_counter() - _process_age()
+        self.phases = {}
+
+    def mark(self, phase):
+        """Records `phase` unless it already was; returns whether this call recorded it."""
+        if phase in self.phases:
+            return False
+        self.phases[phase] = round(time.perf_counter() - self.started, 4)
+        return True
+
+    def summary(self):
+        return ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases.items())
+
+    def render(self):
+        yield "# HELP bot_startup_seconds Seconds from process start to each startup milestone."
+        yield "# TYPE bot_startup_seconds gauge"
+        for phase, seconds in self.phases.items():
+            yield f"bot_startup_seconds{_labels(('phase',), (phase,))} {seconds}"
+
+startup = registry.add(StartupTimer())
+
+
+# === ENDPOINT ===
+async def _serve_metrics(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            pass  # skip headers
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def start_server(port=METRICS_PORT):
+    """Starts the /metrics endpoint on 127.0.0.1; returns None when disabled or the port is taken."""
+    if not port:
+        return None
+    try:
+        server = await asyncio.start_server(_serve_metrics, METRICS_HOST, port)
+    except OSError as e:
+        print(f"Metrics endpoint disabled: {e}")
+        return None
+    print(f"Metrics on http://{METRICS_HOST}:{port}/metrics")
+    return server
+
+
+# === SAMPLING PROFILER ===
+class SamplingProfiler:
+    """Samples one thread's stack from a background thread via sys._current_frames().
+
+    Cheap enough to leave on for a few minutes in production; stacks are kept as
+    "outer;...;inner" strings so the result can be fed straight to flamegraph.pl."""
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.started_at = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, thread_id=None):
+        if self.running:
+            return False
+        target = thread_id or threading.get_ident()
+        self.samples = Counter()
+        self.started_at = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(target,), name="profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return True
+
+    def _run(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def top(self, n=15):
+        """Most frequent innermost frames as (frame, samples)."""
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+profiler = SamplingProfiler()
\ No newline at end of file
@@ -0,0 +1,335 @@
+"""Sharded deployment: one router process fans updates out to N bot worker processes.
+
+    python shard.py --shards 4                          # run the bot sharded
+    python shard.py --loadtest --shards 4 --updates 50000 --chats 200 --heavy-users 1000
+
+The router long-polls Telegram and sends each update to the shard that owns its
+effective chat (get_effective_chat_id semantics), so connected groups always land on
+the same worker. Every worker is a full bot1 application with its own event loop and
+its own database file (group_data.shard<N>.db), so a /muteall or /clean in one huge
+group only occupies its own shard. With BOT_DATABASE_URL set the workers share that
+database instead; each still restores deadlines and purges only for the chats it owns.
+
+/connect and /disconnect are broadcast through the router, which updates its routing
+table and replays the change on every shard so all of them hold the full connection map.
+Existing data in group_data.db is not split across shards automatically.
+Worker N serves its metrics on BOT_METRICS_PORT + N.
+
+--loadtest runs every worker as a full Application against bench.FakeBotAPI: one chat
+runs /muteall over --heavy-users members while the other chats keep posting links, and
+the report gives those other chats' per-update latency. Compare --shards 1 with N.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import asyncio
+import argparse
+import contextlib
+import tempfile
+import multiprocessing as mp
+
+SHARD_DB_TEMPLATE = "group_data.shard{index}.db"
+WORKER_CONCURRENT_UPDATES = 16
+ROUTER_POLL_TIMEOUT = 30
+LOAD_HEAVY_CHAT = -1000000  # the chat that runs /muteall in the load test
+
+
+def shard_for(chat_id, shards):
+    return abs(chat_id) % shards
+
+
+def load_connections(db_paths):
+    """Union of group_connections across every shard database that exists, or the shared
+    database's when BOT_DATABASE_URL is set."""
+    if os.getenv("BOT_DATABASE_URL"):
+        return asyncio.run(_load_shared_connections())
+    targets = {}
+    for path in db_paths:
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(path)
+        try:
+            targets.update(conn.execute("SELECT chat_id, target_chat_id FROM group_connections").fetchall())
+        except sqlite3.OperationalError:
+            pass  # shard never started, no schema yet
+        finally:
+            conn.close()
+    return targets
+
+
+async def _load_shared_connections():
+    from storage import open_storage
+
+    storage = open_storage()
+    await storage.connect()
+    try:
+        return await storage.load_connections()
+    finally:
+        await storage.close()
+
+
+# === WORKER ===
+def run_worker(index, shards, db_path, metrics_port, token, inbound, control):
+    # bot1 reads these at import time, so they must be set before importing it
+    os.environ["BOT_DB_PATH"] = db_path
+    os.environ["BOT_METRICS_PORT"] = str(metrics_port)
+    os.environ["BOT_SHARD_INDEX"] = str(index)
+    os.environ["BOT_SHARD_COUNT"] = str(shards)
+    import bot1
+    asyncio.run(_serve_shard(bot1, token, inbound, control))
+
+
+async def _serve_shard(bot1, token, inbound, control):
+    from telegram import Update
+    from telegram.ext import Application
+
+    builder = Application.builder().updater(None).concurrent_updates(WORKER_CONCURRENT_UPDATES)
+    app = bot1.build_application(builder, token)
+    bot1.connection_cache.listeners.append(lambda chat_id, target: control.put(("connection", chat_id, target)))
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            kind, *payload = await loop.run_in_executor(None, inbound.get)
+            if kind == "update":
+                await app.update_queue.put(Update.de_json(payload[0], app.bot))
+            elif kind == "connection":
+                await bot1.save_group_connection(*payload, notify=False)
+            elif kind == "stop":
+                break
+    finally:
+        await app.stop()
+        await app.post_stop(app)
+        await app.shutdown()
+        await app.post_shutdown(app)
+
+
+# === ROUTER ===
+async def route_updates(token, inbound, control, targets):
+    from telegram import Bot, Update
+
+    shards = len(inbound)
+    loop = asyncio.get_running_loop()
+
+    async def watch_connections():
+        while True:
+            kind, chat_id, target = await loop.run_in_executor(None, control.get)
+            if target is None:
+                targets.pop(chat_id, None)
+            else:
+                targets[chat_id] = target
+            for queue in inbound:
+                queue.put((kind, chat_id, target))
+
+    watcher = asyncio.ensure_future(watch_connections())
+    try:
+        async with Bot(token) as bot:
+            await bot.delete_webhook()
+            offset = None
+            while True:
+                updates = await bot.get_updates(offset=offset, timeout=ROUTER_POLL_TIMEOUT, allowed_updates=Update.ALL_TYPES)
+                for update in updates:
+                    offset = update.update_id + 1
+                    chat_id = update.effective_chat.id if update.effective_chat else 0
+                    inbound[shard_for(targets.get(chat_id, chat_id), shards)].put(("update", update.to_dict()))
+    finally:
+        watcher.cancel()
+
+
+def run_sharded(token, shards):
+    ctx = mp.get_context("spawn")
+    db_paths = [SHARD_DB_TEMPLATE.format(index=i) for i in range(shards)]
+    inbound = [ctx.Queue() for _ in range(shards)]
+    control = ctx.Queue()
+    metrics_port = int(os.getenv("BOT_METRICS_PORT") or 9108)
+    workers = [
+        ctx.Process(target=run_worker, args=(i, shards, db_paths[i], metrics_port and metrics_port + i, token, inbound[i], control), daemon=True)
+        for i in range(shards)
+    ]
+    for worker in workers:
+        worker.start()
+    targets = load_connections(db_paths)
+    # Bring every shard up to the full connection map before routing anything
+    for chat_id, target in targets.items():
+        for queue in inbound:
+            queue.put(("connection", chat_id, target))
+    print(f"Bot is running ({shards} shards)...")
+    try:
+        asyncio.run(route_updates(token, inbound, control, targets))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for queue in inbound:
+            queue.put(("stop",))
+        for worker in workers:
+            worker.join(timeout=10)
+
+
+# === LOAD TEST ===
+def run_load_worker(index, db_path, api_latency, inbound, results):
+    os.environ["BOT_DB_PATH"] = db_path
+    os.environ["BOT_METRICS_PORT"] = "0"
+    import bot1
+    with contextlib.redirect_stdout(sys.stderr):  # keep the JSON report alone on stdout
+        asyncio.run(_load_shard(index, bot1, api_latency, inbound, results))
+
+
+async def _load_shard(index, bot1, api_latency, inbound, results):
+    """A full worker Application against a local fake Bot API; times every update it is sent."""
+    from telegram import Update
+    from telegram.ext import Application
+    from bench import FakeBotAPI, BENCH_TOKEN
+
+    api = FakeBotAPI(api_latency)
+    await api.start()
+    app = bot1.build_application(Application.builder().base_url(api.base_url).updater(None), BENCH_TOKEN)
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(WORKER_CONCURRENT_UPDATES)
+    latencies = {}  # kind -> seconds per update
+    tasks = set()
+
+    async def handle(kind, data):
+        try:
+            started = time.perf_counter()
+            await app.process_update(Update.de_json(data, app.bot))
+            latencies.setdefault(kind, []).append(time.perf_counter() - started)
+        finally:
+            slots.release()
+
+    results.put(("ready",))
+    try:
+        while True:
+            kind, *payload = await loop.run_in_executor(None, inbound.get)
+            if kind == "stop":
+                break
+            await slots.acquire()
+            task = asyncio.ensure_future(handle(kind, payload[0]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+    finally:
+        await app.stop()
+        await app.post_stop(app)
+        await app.shutdown()
+        await app.post_shutdown(app)
+        await api.stop()
+    results.put(("done", index, latencies, dict(api.calls)))
+
+
+def synthetic_update(n, chat_id, user_id, text):
+    message = {
+        "message_id": n, "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "supergroup", "title": f"Load {chat_id} [CLOSED]"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": n, "message": message}
+
+
+def load_updates(updates, chats, heavy_users):
+    """(kind, update) in sending order: `heavy_users` links and then /muteall in the first chat,
+    then `updates` link messages spread over the other chats while the mute runs."""
+    from bench import ADMIN_ID, USER_ID_BASE
+
+    for i in range(heavy_users):
+        user_id = USER_ID_BASE + i
+        yield "setup", synthetic_update(i, LOAD_HEAVY_CHAT, user_id, f"my post https://x.com/user{user_id}/status/{i}")
+    yield "heavy", synthetic_update(heavy_users, LOAD_HEAVY_CHAT, ADMIN_ID, "/muteall")
+    for n in range(updates):
+        user_id = USER_ID_BASE + n
+        chat_id = LOAD_HEAVY_CHAT - 1 - n % max(chats - 1, 1)
+        yield "other", synthetic_update(heavy_users + 1 + n, chat_id, user_id, f"my post https://x.com/user{user_id}/status/{n}")
+
+
+def _percentile_ms(values, q):
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000, 3) if ordered else None
+
+
+def load_test(shards, updates, chats, heavy_users, api_latency):
+    """Replays synthetic traffic through N shard workers, each a full Application on a fake Bot API.
+    One chat runs /muteall over `heavy_users` members while the others keep posting; the report
+    shows whether their latency suffers, which is what sharding is for."""
+    ctx = mp.get_context("spawn")
+    workdir = tempfile.mkdtemp(prefix="bot-loadtest-")
+    inbound = [ctx.Queue() for _ in range(shards)]
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=run_load_worker, args=(i, os.path.join(workdir, SHARD_DB_TEMPLATE.format(index=i)), api_latency, inbound[i], results))
+        for i in range(shards)
+    ]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        results.get()
+
+    started = time.perf_counter()
+    for kind, update in load_updates(updates, chats, heavy_users):
+        inbound[shard_for(update["message"]["chat"]["id"], shards)].put((kind, update))
+    for queue in inbound:
+        queue.put(("stop",))
+    per_shard = [None] * shards  # workers finish in any order; keep the report indexed by shard
+    for _ in workers:
+        _, index, latencies, calls = results.get()
+        per_shard[index] = latencies, calls
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.join()
+
+    def latency(kind):
+        values = [seconds for latencies, _ in per_shard for seconds in latencies.get(kind, [])]
+        return {"updates": len(values), "p50_ms": _percentile_ms(values, 0.5), "p99_ms": _percentile_ms(values, 0.99)}
+
+    heavy = latency("heavy")
+    heavy_shard = shard_for(LOAD_HEAVY_CHAT, shards)
+    return {
+        "shards": shards,
+        "updates": updates,
+        "chats": chats,
+        "heavy_users": heavy_users,
+        "api_latency_ms": api_latency * 1000,
+        "elapsed_s": round(elapsed, 3),
+        "heavy_command_s": heavy["p50_ms"] and round(heavy["p50_ms"] / 1000, 3),
+        "other_chats": latency("other"),
+        "heavy_shard": heavy_shard,
+        "per_shard": [
+            {"shard": index, "heavy": index == heavy_shard, "other_updates": len(latencies.get("other", [])), "other_p99_ms": _percentile_ms(latencies.get("other", []), 0.99),
+             "api_calls": sum(calls.values())}
+            for index, (latencies, calls) in enumerate(per_shard)
+        ],
+        "workdir": workdir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--loadtest", action="store_true", help="replay synthetic traffic instead of connecting to Telegram")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--heavy-users", type=int, default=500, help="members /muteall mutes in the heavy chat during the load test")
+    parser.add_argument("--api-latency", type=float, default=0, help="milliseconds the fake Bot API waits before answering")
+    args = parser.parse_args()
+
+    if args.loadtest:
+        print(json.dumps(load_test(args.shards, args.updates, args.chats, args.heavy_users, args.api_latency / 1000), indent=2))
+        return
+
+    # The router only needs the token; importing bot1 does not open a database
+    import bot1
+    token = bot1.get_bot_token()
+    if token:
+        run_sharded(token, args.shards)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file